@@ -0,0 +1,153 @@
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config import ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SIMILARITY_THRESHOLD
+
+CACHE_HIT = "hit"
+CACHE_SIMILAR = "similar"
+CACHE_MISS = "miss"
+
+
+@dataclass
+class _Entry:
+    answer: str
+    document_url: str
+    created_at: float
+    vector: Optional[np.ndarray]
+
+
+class AnswerCache:
+    """
+    Caches final answers per (document content hash, normalized question).
+
+    Exact matches are served directly. When `similarity_threshold` is set and an
+    embedding model is given, a question whose embedding has cosine similarity at
+    or above the threshold with a cached question about the same document is also
+    served from the cache. Entries expire after `ttl_seconds`; the least recently
+    used ones are dropped beyond `max_entries`.
+    """
+
+    def __init__(
+        self,
+        embedding_model: Optional[Embeddings] = None,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = ANSWER_CACHE_TTL_SECONDS,
+        similarity_threshold: float = ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    ):
+        self.embedding_model = embedding_model
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._by_document: Dict[str, Set[str]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        return re.sub(r"\s+", " ", question).strip().rstrip("?.! ").lower()
+
+    @property
+    def semantic(self) -> bool:
+        return self.embedding_model is not None and 0 < self.similarity_threshold <= 1
+
+    async def alookup(self, document_hash: str, questions: List[str]) -> List[Tuple[Optional[str], str]]:
+        """Returns an (answer or None, cache status) pair per question, in order."""
+        normalized = [self.normalize(q) for q in questions]
+        results: List[Tuple[Optional[str], str]] = []
+        with self._lock:
+            for question in normalized:
+                entry = self._get_live((document_hash, question))
+                results.append((entry.answer, CACHE_HIT) if entry else (None, CACHE_MISS))
+
+        missing = [i for i, (answer, _) in enumerate(results) if answer is None]
+        if missing and self.semantic and self._by_document.get(document_hash):
+            vectors = await self._aembed([questions[i] for i in missing])
+            with self._lock:
+                candidates = []
+                for question in list(self._by_document.get(document_hash, ())):
+                    entry = self._get_live((document_hash, question))
+                    if entry is not None and entry.vector is not None:
+                        candidates.append(entry)
+                if candidates:
+                    similarities = vectors @ np.stack([entry.vector for entry in candidates]).T
+                    for row, i in enumerate(missing):
+                        best = int(np.argmax(similarities[row]))
+                        if similarities[row, best] >= self.similarity_threshold:
+                            results[i] = (candidates[best].answer, CACHE_SIMILAR)
+
+        with self._lock:
+            for _, status in results:
+                if status == CACHE_HIT: self.hits += 1
+                elif status == CACHE_SIMILAR: self.similar_hits += 1
+                else: self.misses += 1
+        return results
+
+    async def astore(self, document_hash: str, document_url: str, questions: List[str], answers: List[str]) -> None:
+        vectors = await self._aembed(questions) if self.semantic else [None] * len(questions)
+        now = time.time()
+        with self._lock:
+            for question, answer, vector in zip(questions, answers, vectors):
+                key = (document_hash, self.normalize(question))
+                self._entries[key] = _Entry(answer, document_url, now, vector)
+                self._entries.move_to_end(key)
+                self._by_document[document_hash].add(key[1])
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, document_hash: Optional[str] = None, document_url: Optional[str] = None) -> int:
+        """Drops entries for a document hash and/or source URL, or everything when neither is given."""
+        with self._lock:
+            keys = [
+                key for key, entry in self._entries.items()
+                if (document_hash is None or key[0] == document_hash) and (document_url is None or entry.document_url == document_url)
+            ]
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.similar_hits + self.misses
+            return {
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.similar_hits) / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+    async def _aembed(self, questions: List[str]) -> np.ndarray:
+        if hasattr(self.embedding_model, "aembed_queries"):
+            vectors = await self.embedding_model.aembed_queries(questions)
+        else:
+            vectors = await self.embedding_model.aembed_documents(questions)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def _get_live(self, key: Tuple[str, str]) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry.created_at > self.ttl_seconds:
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _drop(self, key: Tuple[str, str]) -> None:
+        self._entries.pop(key, None)
+        questions = self._by_document.get(key[0])
+        if questions is not None:
+            questions.discard(key[1])
+            if not questions:
+                del self._by_document[key[0]]
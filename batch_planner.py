@@ -0,0 +1,77 @@
+from dataclasses import dataclass, field
+from typing import List, Set
+
+from langchain_core.documents import Document
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about four characters per token) used for budgeting prompts."""
+    return len(text) // 4 + 1
+
+
+def chunk_key(doc: Document) -> str:
+    return doc.id or doc.metadata.get("chunk_id") or doc.page_content
+
+
+@dataclass
+class GenerationBatch:
+    question_indexes: List[int] = field(default_factory=list)
+    documents: List[Document] = field(default_factory=list)
+    chunk_keys: Set[str] = field(default_factory=set)
+    tokens: int = 0
+
+    def add(self, index: int, question: str, documents: List[Document]) -> None:
+        self.question_indexes.append(index)
+        self.tokens += estimate_tokens(question)
+        for doc in documents:
+            key = chunk_key(doc)
+            if key not in self.chunk_keys:
+                self.chunk_keys.add(key)
+                self.documents.append(doc)
+                self.tokens += estimate_tokens(doc.page_content)
+
+
+def _fit_documents(documents: List[Document], budget: int) -> List[Document]:
+    fitted, used = [], 0
+    for doc in documents:
+        cost = estimate_tokens(doc.page_content)
+        if fitted and used + cost > budget:
+            break
+        fitted.append(doc)
+        used += cost
+    return fitted
+
+
+def plan_generation_batches(
+    questions: List[str],
+    question_documents: List[List[Document]],
+    max_context_tokens: int,
+    max_questions: int,
+) -> List[GenerationBatch]:
+    """
+    Groups questions, each with its own ranked chunks, into sub-batches that fit
+    `max_context_tokens` and hold at most `max_questions` questions.
+
+    Each question joins the open batch that already contains most of its chunks
+    and still has room, so questions about the same clauses share one context.
+    A question whose chunks alone exceed the budget keeps its top-ranked chunks.
+    """
+    batches: List[GenerationBatch] = []
+    for index, (question, documents) in enumerate(zip(questions, question_documents)):
+        documents = _fit_documents(documents, max_context_tokens - estimate_tokens(question))
+        best, best_overlap = None, -1
+        for batch in batches:
+            if len(batch.question_indexes) >= max_questions:
+                continue
+            new_docs = [doc for doc in documents if chunk_key(doc) not in batch.chunk_keys]
+            added = estimate_tokens(question) + sum(estimate_tokens(doc.page_content) for doc in new_docs)
+            if batch.tokens + added > max_context_tokens:
+                continue
+            overlap = len(documents) - len(new_docs)
+            if overlap > best_overlap:
+                best, best_overlap = batch, overlap
+        if best is None:
+            best = GenerationBatch()
+            batches.append(best)
+        best.add(index, question, documents)
+    return batches
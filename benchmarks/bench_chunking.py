@@ -0,0 +1,81 @@
+"""
+Compares the layout-aware chunker with the recursive character splitter.
+
+Chunks a synthetic policy PDF both ways and reports chunk count, estimated
+embedding tokens, how many of the per-section tables end up split across
+chunks, and retrieval hit@k for questions that name a section and ask for a
+table value ("What is the maternity limit in Section 7?"). Retrieval uses the
+offline hashing embeddings and the NumPy store, so no network is needed.
+
+Usage:
+    python benchmarks/bench_chunking.py --pages 40 --k 1 3 5
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from common import make_policy_pdf
+
+
+def chunk(path: str, strategy: str):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from chunker import LayoutChunker
+    from config import CHUNK_SIZE, CHUNK_OVERLAP
+    from pdf_loader import PDFLoader
+
+    loader = PDFLoader(path, parallel=False)
+    if strategy == "layout":
+        return list(LayoutChunker().split(loader.iter_pages()))
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return [piece for document in loader.iter_documents() for piece in splitter.split_documents([document])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    args = parser.parse_args()
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+    from rich import print as rprint
+    from rich.table import Table
+    from batch_planner import estimate_tokens
+    from embeddings import HashingEmbeddings
+    from numpy_store import NumpyVectorStore
+
+    path = make_policy_pdf(os.path.join(tempfile.mkdtemp(prefix="rag-bench-"), "policy.pdf"), pages=args.pages)
+    embeddings = HashingEmbeddings()
+    questions = [f"What is the maternity limit in Section {p + 1}?" for p in range(args.pages)]
+    expected = [str(50000 + p) for p in range(args.pages)]
+    query_vectors = embeddings.embed_documents(questions)
+
+    table = Table(title=f"Chunking a {args.pages}-page policy PDF")
+    for column in ["strategy", "chunks", "embed tokens", "split tables", "time (s)"] + [f"hit@{k}" for k in args.k]:
+        table.add_column(column, justify="right")
+
+    for strategy in ("recursive", "layout"):
+        start = time.perf_counter()
+        chunks = chunk(path, strategy)
+        elapsed = time.perf_counter() - start
+        split_tables = sum(
+            1 for p in range(args.pages)
+            if not any("Benefit" in c.page_content and expected[p] in c.page_content and f"Dental       {10000 + p}" in c.page_content for c in chunks)
+        )
+        store = NumpyVectorStore(embeddings, chunks, np.asarray(embeddings.embed_documents([c.page_content for c in chunks]), dtype=np.float32))
+        hits = store.similarity_search_by_vectors_with_scores(query_vectors, max(args.k))
+        hit_rates = [
+            sum(any(expected[i] in doc.page_content for doc, _ in row[:k]) for i, row in enumerate(hits)) / len(questions)
+            for k in args.k
+        ]
+        table.add_row(
+            strategy, str(len(chunks)), str(sum(estimate_tokens(c.page_content) for c in chunks)), str(split_tables),
+            f"{elapsed:.3f}", *[f"{rate:.2f}" for rate in hit_rates],
+        )
+    rprint(table)
+
+
+if __name__ == "__main__":
+    main()
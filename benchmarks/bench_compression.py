@@ -0,0 +1,119 @@
+"""
+Measures context compression between retrieval and generation.
+
+Chunks and indexes a synthetic policy PDF offline (hashing embeddings, NumPy
+store), retrieves chunks for questions whose answers are known (table limits
+and per-clause payment deadlines, each pinned to a section), plans generation
+batches as the workflow does, and compares each batch's context before and
+after `compress_documents`:
+
+- context tokens sent to the model
+- answer recall: the share of questions whose expected answer is still in the
+  context of their batch, which bounds the accuracy generation can reach
+- compression time per batch
+
+Usage:
+    python benchmarks/bench_compression.py --pages 40 --questions 32 --top-k 5 --chunking layout recursive
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from common import make_policy_pdf, percentile
+
+
+def make_questions(pages: int, count: int, seed: int = 7):
+    rng = random.Random(seed)
+    questions = []
+    for _ in range(count):
+        section = rng.randrange(pages)
+        kind = rng.choice(("maternity", "dental", "clause"))
+        if kind == "maternity":
+            questions.append((f"What is the maternity limit in Section {section + 1}?", str(50000 + section)))
+        elif kind == "dental":
+            questions.append((f"What is the dental benefit limit under Section {section + 1}?", str(10000 + section)))
+        else:
+            line = rng.randrange(30)
+            questions.append((
+                f"Within how many days must the insurer pay claims for benefit {line} under clause {section + 1}.{line}?",
+                f"benefit {line} within {line + 3} days",
+            ))
+    return questions
+
+
+def chunk(path: str, strategy: str):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from chunker import LayoutChunker
+    from config import CHUNK_SIZE, CHUNK_OVERLAP
+    from pdf_loader import PDFLoader
+
+    loader = PDFLoader(path, parallel=False)
+    if strategy == "layout":
+        chunks = list(LayoutChunker().split(loader.iter_pages()))
+    else:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        chunks = [piece for document in loader.iter_documents() for piece in splitter.split_documents([document])]
+    for i, doc in enumerate(chunks):
+        doc.metadata["chunk_id"] = doc.id = f"chunk-{i}"
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--questions", type=int, default=32)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--chunking", nargs="+", choices=["layout", "recursive"], default=["layout", "recursive"])
+    args = parser.parse_args()
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+    from rich import print as rprint
+    from rich.table import Table
+    from batch_planner import estimate_tokens, plan_generation_batches
+    from context_compressor import compress_documents
+    from embeddings import HashingEmbeddings
+    from numpy_store import NumpyVectorStore
+    from config import GENERATION_MAX_CONTEXT_TOKENS, GENERATION_MAX_QUESTIONS_PER_BATCH
+
+    path = make_policy_pdf(os.path.join(tempfile.mkdtemp(prefix="rag-bench-"), "policy.pdf"), pages=args.pages)
+    embeddings = HashingEmbeddings()
+    questions, expected = zip(*make_questions(args.pages, args.questions))
+
+    table = Table(title=f"Context compression ({len(questions)} questions, {args.pages}-section PDF, top-{args.top_k})")
+    for column in ("chunking", "context", "tokens", "recall", "compress p50 (ms)", "compress p95 (ms)"):
+        table.add_column(column, justify="right")
+
+    for strategy in args.chunking:
+        chunks = chunk(path, strategy)
+        store = NumpyVectorStore(embeddings, chunks, np.asarray(embeddings.embed_documents([c.page_content for c in chunks]), dtype=np.float32))
+        hits = store.similarity_search_by_vectors_with_scores(embeddings.embed_documents(list(questions)), args.top_k)
+        question_documents = [[doc for doc, _ in row] for row in hits]
+        batches = plan_generation_batches(list(questions), question_documents, GENERATION_MAX_CONTEXT_TOKENS, GENERATION_MAX_QUESTIONS_PER_BATCH)
+
+        results = {"full": [0, 0], "compressed": [0, 0]}
+        timings = []
+        for batch in batches:
+            batch_questions = [questions[i] for i in batch.question_indexes]
+            start = time.perf_counter()
+            compressed = compress_documents(
+                batch_questions, batch.documents, question_documents=[question_documents[i] for i in batch.question_indexes]
+            )
+            timings.append((time.perf_counter() - start) * 1000)
+            for name, documents in (("full", batch.documents), ("compressed", compressed)):
+                context = "\n\n---\n\n".join(doc.page_content for doc in documents)
+                results[name][0] += estimate_tokens(context)
+                results[name][1] += sum(1 for i in batch.question_indexes if expected[i] in context)
+        for name, (tokens, found) in results.items():
+            table.add_row(
+                strategy, name, str(tokens), f"{found / len(questions):.2f}",
+                f"{percentile(timings, 50):.1f}" if name == "compressed" else "", f"{percentile(timings, 95):.1f}" if name == "compressed" else "",
+            )
+    rprint(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Measures request throughput of the async pipeline as concurrency grows.
+
+Runs the real QueryService (download, parse, embed, decompose, retrieve,
+generate) against a synthetic PDF served locally and the Gemini stub server,
+so the only waits are the simulated network latencies. With a non-blocking
+request path, throughput should scale close to linearly with concurrency
+until the CPU-bound parsing saturates.
+
+Usage:
+    python benchmarks/bench_concurrency.py --concurrency 1 2 4 8 16 --requests 16
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from common import QUESTIONS, make_policy_pdf, percentile, serve_directory
+from stub_server import start_stub_server
+
+
+async def run_level(service, document_url: str, concurrency: int, total: int, shared_document: bool = False):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> float:
+        async with semaphore:
+            start = time.perf_counter()
+            url = document_url if shared_document else f"{document_url}?c={concurrency}&r={i}"
+            await service.aprocess_queries(url, QUESTIONS)
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(i) for i in range(total)))
+    return time.perf_counter() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.8)
+    parser.add_argument("--embed-latency", type=float, default=0.1)
+    parser.add_argument("--stub-port", type=int, default=8765)
+    parser.add_argument("--embedding-backend", choices=["google", "local"], default="google")
+    parser.add_argument("--vector-store", choices=["chroma", "numpy"], default="chroma")
+    parser.add_argument("--retrieval-mode", choices=["vector", "hybrid"], default="vector")
+    parser.add_argument("--no-decompose", action="store_true", help="skip the query decomposition LLM call")
+    parser.add_argument("--shared-document", action="store_true", help="send every request for the same URL (exercises request coalescing)")
+    parser.add_argument("--answer-cache", action="store_true", help="keep the answer cache on (repeat requests then skip the pipeline)")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="rag-bench-")
+    make_policy_pdf(os.path.join(work_dir, "policy.pdf"), pages=args.pages)
+    document_url = f"{serve_directory(work_dir)}/policy.pdf"
+    os.environ["GOOGLE_API_BASE_URL"] = start_stub_server(args.stub_port, args.llm_latency, args.embed_latency)
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    os.environ["INDEX_CACHE_DIR"] = os.path.join(work_dir, "index_cache")
+    os.environ["EMBEDDING_BACKEND"] = args.embedding_backend
+    os.environ["VECTOR_STORE_BACKEND"] = args.vector_store
+    os.environ["RETRIEVAL_MODE"] = args.retrieval_mode
+    os.environ["ENABLE_QUERY_DECOMPOSITION"] = "false" if args.no_decompose else "true"
+    os.environ["ANSWER_CACHE_ENABLED"] = "true" if args.answer_cache else "false"
+
+    from rich import print as rprint
+    from rich.table import Table
+    from query_service import QueryService
+
+    service = QueryService()
+    table = Table(title=f"Throughput vs concurrency ({args.requests} requests, {args.pages}-page PDF)")
+    for column in ("concurrency", "wall (s)", "throughput (req/s)", "p50 (s)", "p95 (s)"):
+        table.add_column(column, justify="right")
+
+    for concurrency in args.concurrency:
+        wall, latencies = asyncio.run(run_level(service, document_url, concurrency, args.requests, args.shared_document))
+        table.add_row(
+            str(concurrency), f"{wall:.2f}", f"{args.requests / wall:.2f}",
+            f"{percentile(latencies, 50):.2f}", f"{percentile(latencies, 95):.2f}",
+        )
+    rprint(table)
+    if args.shared_document:
+        rprint(service.cache_stats()["coalescing"])
+
+
+if __name__ == "__main__":
+    main()
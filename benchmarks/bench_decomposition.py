@@ -0,0 +1,188 @@
+"""
+Measures adaptive query decomposition against always decomposing and never
+decomposing.
+
+Indexes a synthetic policy PDF offline (layout chunks, hashing embeddings, NumPy
+store) and runs the real workflow graph against the Gemini stub server. Each
+request asks a mix of specific questions, whose expected answer is known (table
+limits and per-clause payment deadlines), and vague ones that name no section or
+clause. Reports per mode:
+
+- model calls per request, decomposition calls per request, and decomposition
+  calls saved per request
+- the share of questions sent to decomposition, for specific and vague questions
+- answer recall of specific questions: the share whose expected answer is in the
+  chunks retrieved for them, and how many of the misses were never decomposed
+- request latency
+
+The stub's rewrites carry no meaning, so recall here shows what routing skips,
+not what a real rewrite would recover. A second table sweeps the top-score
+threshold offline to help calibrate it; scores depend on the embedding model,
+so calibrate with the embeddings used in production.
+
+Usage:
+    python benchmarks/bench_decomposition.py --requests 24 --questions-per-request 6 --vague-share 0.25
+    python benchmarks/bench_decomposition.py --vague-share 0.1 --hybrid
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from bench_compression import chunk, make_questions
+from common import make_policy_pdf, percentile
+from stub_server import app as stub_app, start_stub_server
+
+VAGUE_QUESTIONS = [
+    "How quickly are claims settled?",
+    "Is dental treatment covered?",
+    "What are the exclusions?",
+    "How much maternity cover do I get?",
+    "When does the insurer have to pay out?",
+    "What benefits does the policy offer?",
+    "Are pre-existing diseases covered?",
+    "Which section describes the coverage terms?",
+]
+
+
+def make_requests(pages: int, count: int, per_request: int, vague_share: float, seed: int = 11):
+    """Lists of (question, expected answer or None) per request."""
+    rng = random.Random(seed)
+    specific = make_questions(pages, count * per_request, seed)
+    requests = []
+    for r in range(count):
+        questions = []
+        for i in range(per_request):
+            if rng.random() < vague_share:
+                questions.append((rng.choice(VAGUE_QUESTIONS), None))
+            else:
+                questions.append(specific[r * per_request + i])
+        requests.append(questions)
+    return requests
+
+
+async def run_mode(workflow, retriever, requests, decompose: bool, top_k: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    results = [None] * len(requests)
+    latencies = []
+
+    async def one(i: int):
+        questions = [question for question, _ in requests[i]]
+        async with semaphore:
+            start = time.perf_counter()
+            results[i] = await workflow.graph.ainvoke(workflow._input(questions, retriever, top_k, decompose))
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(len(requests))))
+    return results, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--requests", type=int, default=24)
+    parser.add_argument("--questions-per-request", type=int, default=6)
+    parser.add_argument("--vague-share", type=float, default=0.25)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--hybrid", action="store_true", help="fuse BM25 hits as RETRIEVAL_MODE=hybrid does")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--stub-port", type=int, default=8770)
+    parser.add_argument("--min-top-score", type=float, default=0.1, help="DECOMPOSITION_MIN_TOP_SCORE; 0.1 suits the hashing embeddings")
+    parser.add_argument("--min-margin", type=float, help="DECOMPOSITION_MIN_SCORE_MARGIN")
+    parser.add_argument("--sweep", type=float, nargs="*", default=[0.0, 0.08, 0.1, 0.12, 0.15, 0.2])
+    args = parser.parse_args()
+
+    os.environ["GOOGLE_API_BASE_URL"] = start_stub_server(args.stub_port, args.llm_latency, 0.0)
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    os.environ["DECOMPOSITION_MIN_TOP_SCORE"] = str(args.min_top_score)
+    if args.min_margin is not None:
+        os.environ["DECOMPOSITION_MIN_SCORE_MARGIN"] = str(args.min_margin)
+
+    from rich import print as rprint
+    from rich.table import Table
+    from bm25 import BM25Index
+    from embeddings import HashingEmbeddings
+    from numpy_store import NumpyVectorStore
+    from retriever import HybridRetriever
+    from workflow import RAGWorkflow, needs_decomposition
+
+    path = make_policy_pdf(os.path.join(tempfile.mkdtemp(prefix="rag-bench-"), "policy.pdf"), pages=args.pages)
+    embeddings = HashingEmbeddings()
+    chunks = chunk(path, "layout")
+    store = NumpyVectorStore(embeddings, chunks, np.asarray(embeddings.embed_documents([c.page_content for c in chunks]), dtype=np.float32))
+    if args.hybrid:
+        retriever = HybridRetriever(vectorstore=store, search_kwargs={"k": args.top_k}, bm25=BM25Index(chunks))
+    else:
+        retriever = store.as_retriever(search_kwargs={"k": args.top_k})
+    requests = make_requests(args.pages, args.requests, args.questions_per_request, args.vague_share)
+
+    table = Table(title=(
+        f"{args.requests} requests x {args.questions_per_request} questions, {args.vague_share:.0%} vague, "
+        f"top-{args.top_k}{', hybrid' if args.hybrid else ''}"
+    ))
+    for column in (
+        "mode", "model calls / req", "decompose calls / req", "saved / req", "rewritten (specific)", "rewritten (vague)",
+        "recall (specific)", "misses not rewritten", "p50 (s)", "p95 (s)",
+    ):
+        table.add_column(column, justify="right")
+
+    for mode, adaptive, decompose in (("never", False, False), ("always", False, True), ("adaptive", True, True)):
+        workflow = RAGWorkflow(adaptive_decomposition=adaptive)
+        before = dict(stub_app.state.calls)
+        results, latencies = asyncio.run(run_mode(workflow, retriever, requests, decompose, args.top_k, args.concurrency))
+        calls = {key: stub_app.state.calls[key] - before[key] for key in ("generateContent", "decompose")}
+
+        rewritten = {"specific": [0, 0], "vague": [0, 0]}
+        found = missed_skipped = specific = 0
+        for questions, state in zip(requests, results):
+            uncertain = set(state.get("uncertain") or []) if adaptive else set(range(len(questions)) if decompose else [])
+            for i, (_, expected) in enumerate(questions):
+                kind = "vague" if expected is None else "specific"
+                rewritten[kind][0] += i in uncertain
+                rewritten[kind][1] += 1
+                if expected is None:
+                    continue
+                specific += 1
+                hit = any(expected in doc.page_content for doc in state["question_documents"][i])
+                found += hit
+                missed_skipped += not hit and i not in uncertain
+        stats = workflow.decomposition_stats()
+        table.add_row(
+            mode, f"{calls['generateContent'] / len(requests):.2f}", f"{calls['decompose'] / len(requests):.2f}",
+            f"{stats['llm_calls_saved_per_request']:.2f}",
+            f"{rewritten['specific'][0] / max(rewritten['specific'][1], 1):.2f}", f"{rewritten['vague'][0] / max(rewritten['vague'][1], 1):.2f}",
+            f"{found / max(specific, 1):.2f}", str(missed_skipped),
+            f"{percentile(latencies, 50):.2f}", f"{percentile(latencies, 95):.2f}",
+        )
+    rprint(table)
+
+    questions = [question for request in requests for question in request]
+    hits = store.similarity_search_by_vectors_with_scores(embeddings.embed_documents([q for q, _ in questions]), args.top_k)
+    sweep = Table(title="Top-score threshold sweep (offline, original questions only)")
+    for column in ("min top score", "rewritten (specific)", "rewritten (vague)", "requests with no rewrite", "misses not rewritten"):
+        sweep.add_column(column, justify="right")
+    for threshold in args.sweep:
+        routed = [needs_decomposition(h, min_top_score=threshold) for h in hits]
+        is_vague = [expected is None for _, expected in questions]
+        misses = sum(
+            1 for (_, expected), h, r in zip(questions, hits, routed)
+            if expected is not None and not r and not any(expected in doc.page_content for doc, _ in h)
+        )
+        per_request = [routed[i:i + args.questions_per_request] for i in range(0, len(routed), args.questions_per_request)]
+        sweep.add_row(
+            f"{threshold:.2f}",
+            f"{sum(r for r, v in zip(routed, is_vague) if not v) / max(is_vague.count(False), 1):.2f}",
+            f"{sum(r for r, v in zip(routed, is_vague) if v) / max(is_vague.count(True), 1):.2f}",
+            f"{sum(not any(r) for r in per_request) / len(per_request):.2f}",
+            str(misses),
+        )
+    rprint(sweep)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Exercises the model-call layer (llm.py) against a stub server that rate limits
+and injects slow calls.
+
+Runs the real QueryService for a batch of concurrent requests, each for its own
+synthetic PDF, with the stub enforcing a per-model RPM quota, answering a share
+of calls with 429, and making a share of calls slow. Reports request success
+and latency, what the stub saw, and the per-model counters of the call layer
+(retries, rate limits, hedges, fallbacks, time spent throttled client-side).
+
+Model-layer settings are environment variables read at import, so compare
+configurations with separate runs:
+
+    python benchmarks/bench_model_faults.py --error-rate 0.2 --retries 0
+    python benchmarks/bench_model_faults.py --error-rate 0.2
+    python benchmarks/bench_model_faults.py --slow-rate 0.1 --slow-latency 5 --hedging
+    python benchmarks/bench_model_faults.py --rpm 30 --client-rpm 25
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from common import QUESTIONS, make_policy_pdf, percentile, serve_directory
+from stub_server import app as stub_app, start_stub_server
+
+
+async def run(service, document_urls, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], {}
+
+    async def one(url: str):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await service.aprocess_queries(url, QUESTIONS)
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(url) for url in document_urls))
+    return time.perf_counter() - start, latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=24)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--stub-port", type=int, default=8769)
+    parser.add_argument("--rpm", type=int, default=0, help="stub quota per model per minute")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of stub calls answered with 429")
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    parser.add_argument("--retry-delay", type=int, default=1)
+    parser.add_argument("--retries", type=int, help="MODEL_MAX_RETRIES")
+    parser.add_argument("--client-rpm", type=int, default=0, help="client-side RPM bucket for every model")
+    parser.add_argument("--hedging", action="store_true")
+    parser.add_argument("--no-fallback", action="store_true")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="rag-bench-")
+    for i in range(args.requests):
+        make_policy_pdf(os.path.join(work_dir, f"policy-{i + 1}.pdf"), pages=args.pages, variant=i + 1)
+    base_url = serve_directory(work_dir)
+    os.environ["GOOGLE_API_BASE_URL"] = start_stub_server(
+        args.stub_port, args.llm_latency, args.embed_latency,
+        rpm=args.rpm, error_rate=args.error_rate, slow_rate=args.slow_rate, slow_latency=args.slow_latency, retry_delay=args.retry_delay,
+    )
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    os.environ["ANSWER_CACHE_ENABLED"] = "false"
+    os.environ["INDEX_CACHE_DIR"] = os.path.join(work_dir, "index_cache")
+    os.environ["MODEL_HEDGING_ENABLED"] = "true" if args.hedging else "false"
+    os.environ["MODEL_FALLBACK_ENABLED"] = "false" if args.no_fallback else "true"
+    if args.retries is not None:
+        os.environ["MODEL_MAX_RETRIES"] = str(args.retries)
+    if args.client_rpm:
+        for name in ("ANSWER_LLM_RPM", "QUERY_LLM_RPM", "EMBEDDING_RPM"):
+            os.environ[name] = str(args.client_rpm)
+
+    from rich import print as rprint
+    from rich.table import Table
+    from llm import model_stats
+    from query_service import QueryService
+
+    service = QueryService()
+    elapsed, latencies, errors = asyncio.run(run(service, [f"{base_url}/policy-{i + 1}.pdf" for i in range(args.requests)], args.concurrency))
+
+    summary = Table(title=f"{args.requests} requests, concurrency {args.concurrency}")
+    for column in ("ok", "failed", "p50 (s)", "p95 (s)", "p99 (s)", "wall (s)", "stub calls"):
+        summary.add_column(column, justify="right")
+    summary.add_row(
+        str(len(latencies)), json.dumps(errors) if errors else "0",
+        f"{percentile(latencies, 50):.2f}", f"{percentile(latencies, 95):.2f}", f"{percentile(latencies, 99):.2f}", f"{elapsed:.2f}",
+        json.dumps(stub_app.state.calls),
+    )
+    rprint(summary)
+
+    stats = model_stats()
+    models = Table(title="Model-call layer")
+    columns = ("calls", "retries", "rate_limited", "hedges", "hedge_wins", "fallbacks", "failures", "throttled_seconds")
+    models.add_column("model")
+    for column in columns:
+        models.add_column(column, justify="right")
+    for model, s in stats.items():
+        models.add_row(model, *[str(s[c]) for c in columns])
+    rprint(models)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Compares serial and process-pool PDF extraction on a synthetic multi-hundred-page PDF.
+
+Reports total extraction time, time to the first yielded Document (what the
+splitter waits for when streaming) and checks that both modes produce the
+same pages in the same order. The pool is warmed up before timing, as it is
+in a long-running worker.
+
+Usage:
+    PDF_PARSE_WORKERS=4 python benchmarks/bench_pdf_extraction.py --pages 300 --repeat 3
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from common import make_policy_pdf
+
+
+def time_mode(loader_cls, path: str, parallel: bool):
+    start = time.perf_counter()
+    first = None
+    documents = []
+    for document in loader_cls(path, parallel=parallel).iter_documents():
+        if first is None:
+            first = time.perf_counter() - start
+        documents.append(document)
+    return time.perf_counter() - start, first or 0.0, documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+    from rich import print as rprint
+    from rich.table import Table
+    from config import PDF_PARSE_WORKERS
+    from pdf_loader import PDFLoader
+
+    path = make_policy_pdf(os.path.join(tempfile.mkdtemp(prefix="rag-bench-"), "policy.pdf"), pages=args.pages)
+    time_mode(PDFLoader, path, parallel=True)
+
+    table = Table(title=f"PDF extraction, {args.pages} pages, {PDF_PARSE_WORKERS} workers (best of {args.repeat})")
+    for column in ("mode", "total (s)", "first document (s)", "pages/s"):
+        table.add_column(column, justify="right")
+
+    outputs = {}
+    for mode, parallel in (("serial", False), ("parallel", True)):
+        runs = [time_mode(PDFLoader, path, parallel) for _ in range(args.repeat)]
+        total, first, documents = min(runs, key=lambda run: run[0])
+        outputs[mode] = [(d.metadata["page"], d.page_content) for d in documents]
+        table.add_row(mode, f"{total:.3f}", f"{first:.3f}", f"{args.pages / total:.1f}")
+
+    rprint(table)
+    rprint(f"Outputs identical: {outputs['serial'] == outputs['parallel']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Offline end-to-end benchmark of the real QueryService pipeline.
+
+Generates synthetic PDF, DOCX and EML policy documents, serves them from a
+local HTTP server and answers a fixed question set against the Gemini stub
+server, so runs are deterministic and need no network. Every request gets its
+own document with distinct text and the answer cache is off, so each one
+downloads, parses, embeds, indexes, retrieves and generates.
+
+Reports, per format, request latency p50/p95/p99, throughput and the process
+peak resident set size, then per stage the p50/p95/p99 span duration and the
+largest RSS growth seen within one run of that stage: the highest RSS sampled
+while it ran minus the RSS when it started. Stages come from the spans in
+`metrics.py`. RSS covers this process only, not PDF parsing worker processes,
+and concurrent requests overlap, so a stage's growth includes whatever else ran
+alongside it; run with --concurrency 1 to isolate stages. Without /proc only the
+process high-water mark can be read, so growth then shows only new peaks.
+
+Results can be written as JSON and later runs compared against that baseline;
+the script exits with status 1 when a p95 latency, the process peak RSS or a
+stage's RSS growth regresses by more than --tolerance.
+
+Usage:
+    python benchmarks/bench_pipeline.py --formats pdf docx --pages 20 --requests 12 --concurrency 4 --output baseline.json
+    python benchmarks/bench_pipeline.py --formats pdf docx --pages 20 --requests 12 --concurrency 4 --baseline baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from common import CORPUS_WRITERS, QUESTIONS, percentile, serve_directory
+from stub_server import start_stub_server
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss_bytes() -> int:
+    """Current RSS from /proc on Linux, falling back to the process peak elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RSSSampler:
+    """Samples this process's RSS on a daemon thread so peaks can be matched to stage intervals."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: List[Tuple[float, int]] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.samples.append((time.perf_counter(), current_rss_bytes()))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _at(self, t: float) -> int:
+        before = [rss for sample_t, rss in self.samples if sample_t <= t]
+        return before[-1] if before else 0
+
+    def peak_between(self, start: float, end: float) -> int:
+        inside = [rss for t, rss in self.samples if start <= t <= end]
+        return max(inside) if inside else self._at(end)
+
+    def growth_between(self, start: float, end: float) -> int:
+        """How far RSS rose above its level at `start` before `end`."""
+        return max(0, self.peak_between(start, end) - self._at(start))
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "count": len(values),
+    }
+
+
+async def run_format(service, document_urls: List[str], concurrency: int, sampler: RSSSampler) -> dict:
+    import metrics
+
+    semaphore = asyncio.Semaphore(concurrency)
+    stage_seconds: Dict[str, List[float]] = defaultdict(list)
+    stage_rss_growth: Dict[str, int] = defaultdict(int)
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    async def one(i: int):
+        async with semaphore:
+            timings = metrics.start_request_timings()
+            start = time.perf_counter()
+            try:
+                await service.aprocess_queries(document_urls[i], QUESTIONS)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                return
+            latencies.append(time.perf_counter() - start)
+            for stage, seconds, ended_at in timings:
+                stage_seconds[stage].append(seconds)
+                stage_rss_growth[stage] = max(stage_rss_growth[stage], sampler.growth_between(ended_at - seconds, ended_at))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(len(document_urls))))
+    end = time.perf_counter()
+    wall = end - start
+    return {
+        "latency": summarize(latencies),
+        "throughput": len(latencies) / wall if wall else 0.0,
+        "process_peak_rss_mb": round(sampler.peak_between(start, end) / 2**20, 1),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "stages": {
+            stage: {**summarize(values), "rss_growth_mb": round(stage_rss_growth[stage] / 2**20, 1)}
+            for stage, values in stage_seconds.items()
+        },
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Lists p95 latency and RSS regressions beyond `tolerance` (a fraction) relative
+    to the baseline. Increases under 10 ms or 1 MB are treated as noise.
+    """
+    regressions = []
+
+    def check(label: str, current: float, previous: float, floor: float = 0.01):
+        if previous and current > previous * (1 + tolerance) and current - previous > floor:
+            regressions.append(f"{label}: {previous:.3f} -> {current:.3f} (+{(current / previous - 1) * 100:.0f}%)")
+
+    for fmt, current in results["formats"].items():
+        previous = baseline.get("formats", {}).get(fmt)
+        if not previous:
+            continue
+        check(f"{fmt} request p95 (s)", current["latency"]["p95"], previous["latency"]["p95"])
+        check(f"{fmt} process peak RSS (MB)", current["process_peak_rss_mb"], previous.get("process_peak_rss_mb", 0), floor=1.0)
+        for stage, stats in current["stages"].items():
+            old = previous["stages"].get(stage)
+            if old:
+                check(f"{fmt} {stage} p95 (s)", stats["p95"], old["p95"])
+                check(f"{fmt} {stage} RSS growth (MB)", stats["rss_growth_mb"], old.get("rss_growth_mb", 0), floor=1.0)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--formats", nargs="+", choices=sorted(CORPUS_WRITERS), default=["pdf", "docx", "eml"])
+    parser.add_argument("--pages", type=int, default=20, help="sections per synthetic document")
+    parser.add_argument("--requests", type=int, default=12, help="requests per format")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--stub-port", type=int, default=8766)
+    parser.add_argument("--embedding-backend", choices=["google", "local"], default="google")
+    parser.add_argument("--vector-store", choices=["chroma", "numpy"], default="chroma")
+    parser.add_argument("--retrieval-mode", choices=["vector", "hybrid"], default="vector")
+    parser.add_argument("--output", help="write the results as JSON to this path; the file can serve as a later --baseline")
+    parser.add_argument("--baseline", help="compare against results written earlier with --output")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression before failing")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="rag-bench-")
+    for fmt in args.formats:
+        for i in range(args.requests):
+            CORPUS_WRITERS[fmt](os.path.join(work_dir, f"policy-{i + 1}.{fmt}"), pages=args.pages, variant=i + 1)
+    base_url = serve_directory(work_dir)
+    os.environ["GOOGLE_API_BASE_URL"] = start_stub_server(args.stub_port, args.llm_latency, args.embed_latency)
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    os.environ["EMBEDDING_BACKEND"] = args.embedding_backend
+    os.environ["VECTOR_STORE_BACKEND"] = args.vector_store
+    os.environ["RETRIEVAL_MODE"] = args.retrieval_mode
+    os.environ["ANSWER_CACHE_ENABLED"] = "false"
+    os.environ["INDEX_CACHE_DIR"] = os.path.join(work_dir, "index_cache")
+
+    from rich import print as rprint
+    from rich.table import Table
+    from query_service import QueryService
+
+    service = QueryService()
+    results = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "tolerance")},
+        "environment": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "formats": {},
+    }
+    with RSSSampler() as sampler:
+        for fmt in args.formats:
+            results["formats"][fmt] = asyncio.run(run_format(service, [f"{base_url}/policy-{i + 1}.{fmt}" for i in range(args.requests)], args.concurrency, sampler))
+
+    summary = Table(title=f"End-to-end ({args.requests} requests per format, concurrency {args.concurrency}, {args.pages} sections)")
+    for column in ("format", "ok", "errors", "p50 (s)", "p95 (s)", "p99 (s)", "throughput (req/s)", "process peak RSS (MB)"):
+        summary.add_column(column, justify="right")
+    for fmt, r in results["formats"].items():
+        latency = r["latency"]
+        summary.add_row(
+            fmt, str(latency["count"]), str(r["errors"]), f"{latency['p50']:.3f}", f"{latency['p95']:.3f}", f"{latency['p99']:.3f}",
+            f"{r['throughput']:.2f}", f"{r['process_peak_rss_mb']:.1f}",
+        )
+    rprint(summary)
+
+    for fmt, r in results["formats"].items():
+        if r["first_error"]:
+            rprint(f"[red]{fmt}: {r['first_error']}[/red]")
+        if not r["stages"]:
+            continue
+        stages = Table(title=f"Stages: {fmt}")
+        for column in ("stage", "count", "p50 (s)", "p95 (s)", "p99 (s)", "max RSS growth (MB)"):
+            stages.add_column(column, justify="right")
+        for stage, s in r["stages"].items():
+            stages.add_row(stage, str(s["count"]), f"{s['p50']:.4f}", f"{s['p95']:.4f}", f"{s['p99']:.4f}", f"{s['rss_growth_mb']:.1f}")
+        rprint(stages)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        rprint(f"Wrote results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            rprint(f"[bold red]{len(regressions)} regression(s) beyond {args.tolerance:.0%}:[/bold red]")
+            for line in regressions:
+                rprint(f"  {line}")
+            sys.exit(1)
+        rprint(f"[green]No regressions beyond {args.tolerance:.0%} against {args.baseline}.[/green]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Measures worker start-up: import time of `main` and time to the first successful
+`/hackrx/run`, for each startup mode.
+
+Every run launches a fresh uvicorn process against the Gemini stub server and a
+local file server holding synthetic policy PDFs, then records:
+
+- import: wall time of `import main` in a separate interpreter
+- ready: process launch until `/health` answers
+- first ok: process launch until the first `/hackrx/run` returns 200
+- first req / second req: latency of the first request and of a second one for
+  a different document, i.e. what the first user pays versus steady state
+
+Modes are "lazy" (clients built on the first request), "eager" (built in the
+lifespan hook) and "eager+warmup" (also one embedding, LLM and PDF pool call).
+
+Usage:
+    python benchmarks/bench_startup.py --runs 3 --modes lazy eager eager+warmup
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+from common import QUESTIONS, ROOT_DIR, make_policy_pdf, percentile, serve_directory
+from stub_server import start_stub_server
+
+MODES = {
+    "lazy": {"STARTUP_MODE": "lazy", "STARTUP_WARMUP": "false"},
+    "eager": {"STARTUP_MODE": "eager", "STARTUP_WARMUP": "false"},
+    "eager+warmup": {"STARTUP_MODE": "eager", "STARTUP_WARMUP": "true"},
+}
+
+
+def measure_import(env: Dict[str, str]) -> float:
+    code = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def measure_server(env: Dict[str, str], port: int, document_urls: List[str], timeout: float) -> Dict[str, float]:
+    headers = {"Authorization": f"Bearer {env['API_AUTH_TOKEN']}"}
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with status {process.returncode}")
+                if time.perf_counter() - start > timeout:
+                    raise TimeoutError("server did not become ready")
+                try:
+                    if client.get("/health").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+            ready = time.perf_counter() - start
+
+            latencies = []
+            for url in document_urls:
+                request_start = time.perf_counter()
+                response = client.post("/hackrx/run", json={"documents": url, "questions": QUESTIONS}, headers=headers)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - request_start)
+                if len(latencies) == 1:
+                    first_ok = time.perf_counter() - start
+        return {"ready": ready, "first ok": first_ok, "first req": latencies[0], "second req": latencies[1]}
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--stub-port", type=int, default=8768)
+    parser.add_argument("--port", type=int, default=8780)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    from rich import print as rprint
+    from rich.table import Table
+
+    work_dir = tempfile.mkdtemp(prefix="rag-bench-")
+    for i in range(2):
+        make_policy_pdf(os.path.join(work_dir, f"policy-{i + 1}.pdf"), pages=args.pages, variant=i + 1)
+    base_url = serve_directory(work_dir)
+    document_urls = [f"{base_url}/policy-{i + 1}.pdf" for i in range(2)]
+    base_env = dict(
+        os.environ,
+        GOOGLE_API_BASE_URL=start_stub_server(args.stub_port, args.llm_latency, args.embed_latency),
+        GOOGLE_API_KEY=os.environ.get("GOOGLE_API_KEY", "benchmark"),
+        API_AUTH_TOKEN="benchmark",
+        ANSWER_CACHE_ENABLED="false",
+        METRICS_ENABLED="false",
+    )
+
+    columns = ("import", "ready", "first ok", "first req", "second req")
+    table = Table(title=f"Start-up ({args.runs} runs per mode, median / worst, seconds)")
+    table.add_column("mode")
+    for column in columns:
+        table.add_column(column, justify="right")
+    for mode in args.modes:
+        samples: Dict[str, List[float]] = {column: [] for column in columns}
+        for run in range(args.runs):
+            env = dict(base_env, **MODES[mode], INDEX_CACHE_DIR=os.path.join(work_dir, f"index-{mode}-{run}"))
+            samples["import"].append(measure_import(env))
+            for column, value in measure_server(env, args.port, document_urls, args.timeout).items():
+                samples[column].append(value)
+        table.add_row(mode, *[f"{percentile(samples[c], 50):.3f} / {max(samples[c]):.3f}" for c in columns])
+    rprint(table)
+
+
+if __name__ == "__main__":
+    main()
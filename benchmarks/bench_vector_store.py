@@ -0,0 +1,77 @@
+"""
+Compares the NumPy vector store with per-request Chroma collections.
+
+For each corpus size it measures index build time from precomputed embeddings
+(what a cache hit pays) and search latency for a single query and for a batch
+of decomposed queries, with query embedding excluded. Vectors are random
+unit vectors of the embedding dimension.
+
+Usage:
+    python benchmarks/bench_vector_store.py --sizes 100 1000 10000 --dim 768
+"""
+import argparse
+import os
+import time
+import uuid
+
+import numpy as np
+
+import common  # noqa: F401  (puts the project root on sys.path)
+
+
+def best_of(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--batch", type=int, default=20, help="queries per batched search")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+    from langchain_core.documents import Document
+    from rich import print as rprint
+    from rich.table import Table
+    from embeddings import HashingEmbeddings
+    from retriever import VectorStoreProvider, _chroma_multi_query
+
+    rng = np.random.default_rng(0)
+    table = Table(title=f"Vector store build and search (dim={args.dim}, k={args.k}, best of {args.repeat})")
+    for column in ("chunks", "backend", "build (ms)", "1 query (ms)", f"{args.batch} queries (ms)"):
+        table.add_column(column, justify="right")
+
+    for size in args.sizes:
+        vectors = rng.standard_normal((size, args.dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        queries = vectors[rng.integers(0, size, args.batch)] + 0.1 * rng.standard_normal((args.batch, args.dim)).astype(np.float32)
+        for backend in ("chroma", "numpy"):
+            provider = VectorStoreProvider(None, embedding_model=HashingEmbeddings(args.dim), vector_store_backend=backend)
+            docs = [Document(page_content=f"chunk {i}", metadata={"chunk_id": f"c{i}"}) for i in range(size)]
+            stores = []
+            build = best_of(args.repeat, lambda: stores.append(provider._build_store(uuid.uuid4().hex, docs, vectors)))
+            db = stores[-1]
+            if backend == "numpy":
+                search = lambda q: db.similarity_search_by_vectors_with_scores(q, args.k)
+            else:
+                search = lambda q: _chroma_multi_query(db, q, args.k)
+            single = best_of(args.repeat, lambda: search(queries[:1]))
+            batched = best_of(args.repeat, lambda: search(queries))
+            table.add_row(str(size), backend, f"{build * 1000:.1f}", f"{single * 1000:.2f}", f"{batched * 1000:.2f}")
+            if backend == "chroma":
+                for store in stores:
+                    store.delete_collection()
+
+    rprint(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Shared helpers for the benchmark scripts: synthetic documents, a local file server and stats."""
+import functools
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from typing import List
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+QUESTIONS = [
+    "What is the waiting period for maternity benefits?",
+    "Within how many days must the insurer pay a claim?",
+    "What is the limit for maternity cover?",
+    "Which section describes the coverage terms?",
+    "Are pre-existing diseases covered?",
+]
+
+
+def make_policy_pdf(path: str, pages: int = 20, variant: int = 0) -> str:
+    """Writes a synthetic insurance-policy PDF with headings, clauses and a small table per page."""
+    import fitz
+
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 60), f"Section {p + 1}: Coverage Terms", fontsize=16)
+        y = 90
+        for line in _clause_lines(p + 1, variant):
+            page.insert_text((72, y), line, fontsize=9)
+            y += 13
+        page.insert_text((72, y + 12), "Benefit      Limit      Waiting Period", fontsize=9)
+        page.insert_text((72, y + 26), f"Maternity    {50000 + p}      24 months", fontsize=9)
+        page.insert_text((72, y + 40), f"Dental       {10000 + p}      6 months", fontsize=9)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def _clause_lines(section: int, variant: int = 0, lines: int = 30) -> List[str]:
+    """Policy clauses; a non-zero `variant` makes every line unique to that document, defeating embedding caches."""
+    prefix = f"Policy {variant}: " if variant else ""
+    return [f"{prefix}Clause {section}.{line} The insurer shall pay claims for benefit {line} within {line + 3} days of notice." for line in range(lines)]
+
+
+def make_policy_docx(path: str, pages: int = 20, variant: int = 0) -> str:
+    """Writes a DOCX with the same content as `make_policy_pdf`: one heading, clauses and a table per section."""
+    import docx
+
+    document = docx.Document()
+    for p in range(pages):
+        document.add_heading(f"Section {p + 1}: Coverage Terms", level=1)
+        for line in _clause_lines(p + 1, variant):
+            document.add_paragraph(line)
+        table = document.add_table(rows=3, cols=3)
+        for row, values in zip(table.rows, [("Benefit", "Limit", "Waiting Period"), ("Maternity", str(50000 + p), "24 months"), ("Dental", str(10000 + p), "6 months")]):
+            for cell, value in zip(row.cells, values):
+                cell.text = value
+    document.save(path)
+    return path
+
+
+def make_policy_eml(path: str, pages: int = 20, variant: int = 0) -> str:
+    """Writes a plain-text policy e-mail whose body carries the same sections as `make_policy_pdf`."""
+    from email.message import EmailMessage
+
+    body = []
+    for p in range(pages):
+        body.append(f"Section {p + 1}: Coverage Terms")
+        body.extend(_clause_lines(p + 1, variant))
+        body.append(f"Benefit: Maternity, Limit: {50000 + p}, Waiting Period: 24 months")
+        body.append("")
+    message = EmailMessage()
+    message["From"] = "claims@insurer.example"
+    message["To"] = "policyholder@example.com"
+    message["Subject"] = "Your policy wording"
+    message.set_content("\n".join(body))
+    with open(path, "wb") as f:
+        f.write(bytes(message))
+    return path
+
+
+CORPUS_WRITERS = {"pdf": make_policy_pdf, "docx": make_policy_docx, "eml": make_policy_eml}
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_directory(directory: str, port: int = 0) -> str:
+    """Serves `directory` over HTTP on a daemon thread and returns its base URL."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), functools.partial(_QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
@@ -0,0 +1,177 @@
+"""
+A local stand-in for the Gemini REST API, used by the benchmarks so the real
+LangChain clients can be exercised without network access or quota.
+
+It answers `generateContent`, `embedContent` and `batchEmbedContents` with
+deterministic payloads after a configurable delay. Point the application at it
+with `GOOGLE_API_BASE_URL=http://127.0.0.1:<port>`.
+
+Faults can be injected to exercise the model-call layer: a per-model
+requests-per-minute quota and a random share of calls that get a Gemini-style
+429 RESOURCE_EXHAUSTED (with a RetryInfo delay), and a random share of calls
+that take `--slow-latency` instead of the usual delay.
+
+Run standalone:
+    python benchmarks/stub_server.py --port 8765 --llm-latency 0.8 --embed-latency 0.05
+    python benchmarks/stub_server.py --port 8765 --rpm 60 --error-rate 0.1 --slow-rate 0.05 --slow-latency 10
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+EMBEDDING_DIM = 256
+
+app = FastAPI(title="Gemini Stub")
+app.state.llm_latency = 0.8
+app.state.embed_latency = 0.05
+app.state.calls = {"generateContent": 0, "decompose": 0, "embed": 0, "rate_limited": 0, "slow": 0}
+app.state.rpm = 0
+app.state.error_rate = 0.0
+app.state.slow_rate = 0.0
+app.state.slow_latency = 10.0
+app.state.retry_delay = 1
+_recent_calls = defaultdict(deque)
+
+
+def stub_embedding(text: str) -> list:
+    """Hashed bag-of-words vector, so lexically similar texts land close together."""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for token in re.findall(r"\w+", text.lower()):
+        vector[int(hashlib.md5(token.encode()).hexdigest(), 16) % EMBEDDING_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def _count_questions(prompt: str) -> int:
+    section = prompt.rsplit("QUESTIONS:", 1)[-1]
+    return max(1, len(re.findall(r"^\s*\d+\.\s", section, flags=re.MULTILINE)))
+
+
+def _fill_schema(schema: dict, n: int, defs: dict, position: int = 0):
+    if "$ref" in schema:
+        schema = defs[schema["$ref"].rsplit("/", 1)[-1]]
+    if "anyOf" in schema:
+        schema = next(s for s in schema["anyOf"] if s.get("type") != "null")
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: _fill_schema(sub, n, defs, position) for name, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [_fill_schema(schema.get("items", {}), n, defs, i) for i in range(n)]
+    if kind in ("integer", "number"):
+        return position + 1
+    if kind == "boolean":
+        return False
+    return f"Stub answer {position + 1}."
+
+
+def _generate(body: dict) -> str:
+    prompt = "\n".join(part.get("text", "") for c in body.get("contents", []) for part in c.get("parts", []))
+    n = _count_questions(prompt)
+    schema = body.get("generationConfig", {}).get("responseJsonSchema")
+    if schema:
+        return json.dumps(_fill_schema(schema, n, schema.get("$defs", {})))
+    if "query decomposition" in prompt:
+        app.state.calls["decompose"] += 1
+        return json.dumps([[f"stub query {i + 1}{s}" for s in "abc"] for i in range(n)])
+    return "Stub answer."
+
+
+def _rate_limited(model: str) -> bool:
+    """Applies the per-model quota over a sliding minute, then the random error rate."""
+    if app.state.rpm:
+        now = time.monotonic()
+        window = _recent_calls[model]
+        while window and now - window[0] > 60:
+            window.popleft()
+        if len(window) >= app.state.rpm:
+            return True
+        window.append(now)
+    return random.random() < app.state.error_rate
+
+
+def _rate_limit_response(model: str) -> JSONResponse:
+    app.state.calls["rate_limited"] += 1
+    return JSONResponse(status_code=429, content={"error": {
+        "code": 429,
+        "message": f"Resource has been exhausted (e.g. check quota) for {model}.",
+        "status": "RESOURCE_EXHAUSTED",
+        "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{app.state.retry_delay}s"}],
+    }})
+
+
+async def _delay(latency: float) -> None:
+    if random.random() < app.state.slow_rate:
+        app.state.calls["slow"] += 1
+        latency = app.state.slow_latency
+    await asyncio.sleep(latency)
+
+
+@app.post("/{api_version}/models/{target}")
+async def models_endpoint(api_version: str, target: str, request: Request):
+    body = await request.json()
+    model, method = target.rsplit(":", 1)
+    if _rate_limited(model):
+        return _rate_limit_response(model)
+    if method == "generateContent":
+        app.state.calls["generateContent"] += 1
+        await _delay(app.state.llm_latency)
+        text = _generate(body)
+        return {
+            "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP"}],
+            "usageMetadata": {"promptTokenCount": len(json.dumps(body)) // 4, "candidatesTokenCount": len(text) // 4},
+        }
+    app.state.calls["embed"] += 1
+    await _delay(app.state.embed_latency)
+    if method == "batchEmbedContents":
+        texts = [" ".join(p.get("text", "") for p in r["content"]["parts"]) for r in body.get("requests", [])]
+        return {"embeddings": [{"values": stub_embedding(t)} for t in texts]}
+    text = " ".join(p.get("text", "") for p in body.get("content", {}).get("parts", []))
+    return {"embedding": {"values": stub_embedding(text)}}
+
+
+def configure_faults(rpm: int = 0, error_rate: float = 0.0, slow_rate: float = 0.0, slow_latency: float = 10.0, retry_delay: int = 1) -> None:
+    app.state.rpm = rpm
+    app.state.error_rate = error_rate
+    app.state.slow_rate = slow_rate
+    app.state.slow_latency = slow_latency
+    app.state.retry_delay = retry_delay
+
+
+def start_stub_server(port: int = 8765, llm_latency: float = 0.8, embed_latency: float = 0.05, **faults) -> str:
+    """Starts the stub server on a daemon thread and returns its base URL; `faults` go to `configure_faults`."""
+    app.state.llm_latency = llm_latency
+    app.state.embed_latency = embed_latency
+    configure_faults(**faults)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--llm-latency", type=float, default=0.8)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--rpm", type=int, default=0, help="per-model requests per minute before answering 429 (0 = no quota)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with 429 regardless of quota")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of calls that take --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=10.0)
+    parser.add_argument("--retry-delay", type=int, default=1, help="seconds suggested in the 429 RetryInfo")
+    args = parser.parse_args()
+    app.state.llm_latency = args.llm_latency
+    app.state.embed_latency = args.embed_latency
+    configure_faults(args.rpm, args.error_rate, args.slow_rate, args.slow_latency, args.retry_delay)
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
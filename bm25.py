@@ -0,0 +1,80 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+_TOKEN_RE = re.compile(r"\d+(?:\.\d+)+|[a-z0-9]+")
+_STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the this to was were what when which who will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens; dotted numbers such as clause "4.2.1" stay a single token."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOP_WORDS]
+
+
+class BM25Index:
+    """
+    An Okapi BM25 inverted index over a fixed list of chunks.
+
+    Postings are stored as NumPy arrays per term, so scoring a query only touches
+    the documents that contain its terms.
+    """
+
+    def __init__(self, documents: List[Document], k1: float = 1.5, b: float = 0.75):
+        self.documents = documents
+        self.k1 = k1
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        lengths = np.zeros(len(documents), dtype=np.float32)
+        for doc_id, doc in enumerate(documents):
+            counts = Counter(tokenize(doc.page_content))
+            lengths[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                postings[term].append((doc_id, tf))
+
+        n_docs = len(documents)
+        avg_length = float(lengths.mean()) if n_docs and lengths.mean() > 0 else 1.0
+        self._length_norm = k1 * (1 - b + b * lengths / avg_length)
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray, float]] = {}
+        for term, entries in postings.items():
+            doc_ids = np.fromiter((d for d, _ in entries), dtype=np.int64, count=len(entries))
+            tfs = np.fromiter((tf for _, tf in entries), dtype=np.float32, count=len(entries))
+            idf = math.log(1 + (n_docs - len(entries) + 0.5) / (len(entries) + 0.5))
+            self._postings[term] = (doc_ids, tfs, idf)
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[Document, float]]:
+        scores = np.zeros(len(self.documents), dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            doc_ids, tfs, idf = posting
+            scores[doc_ids] += idf * tfs * (self.k1 + 1) / (tfs + self._length_norm[doc_ids])
+
+        candidates = np.flatnonzero(scores)
+        if not len(candidates):
+            return []
+        k = min(k, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(self.documents[i], float(scores[i])) for i in top]
+
+    def search_many(self, queries: List[str], k: int = 5) -> List[List[Tuple[Document, float]]]:
+        return [self.search(query, k) for query in queries]
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int, rrf_k: int = 60) -> List[Tuple[Document, float]]:
+    """Fuses ranked lists by summing 1 / (rrf_k + rank) per chunk; returns the top k with fused scores."""
+    scores: Dict[str, float] = defaultdict(float)
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = doc.id or doc.metadata.get("chunk_id") or doc.page_content
+            scores[key] += 1.0 / (rrf_k + rank)
+            documents.setdefault(key, doc)
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+    return [(documents[key], score) for key, score in fused]
@@ -0,0 +1,166 @@
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from batch_planner import estimate_tokens
+from config import CHUNK_SIZE, CHUNK_OVERLAP
+
+HEADING_SIZE_RATIO = 1.15
+MAX_HEADING_CHARS = 120
+SECTION_SEPARATOR = " > "
+
+_TABLE_LINE_RE = re.compile(r"(\s{2,}|\t)")
+
+
+def is_table_line(line_text: str) -> bool:
+    return bool(_TABLE_LINE_RE.search(line_text)) and len(line_text.strip()) > 10
+
+
+@dataclass(frozen=True)
+class LayoutLine:
+    text: str
+    size: Optional[float] = None  # largest font size on the line, None for plain-text sources
+    is_table: bool = False
+
+
+def lines_from_text(text: str) -> List[LayoutLine]:
+    """Layout lines for sources without font information; only table rows are recognised."""
+    return [LayoutLine(line, None, is_table_line(line)) for line in text.splitlines() if line.strip()]
+
+
+class LayoutChunker:
+    """
+    Splits a stream of pages into chunks along the document's own structure.
+
+    Lines set noticeably larger than the body font open a new section. Their
+    text becomes the chunk's section path, which is also prefixed to the chunk
+    (and counted against its size) so that it is embedded with its context.
+    Consecutive table rows are kept in one chunk where they fit. Larger tables
+    are split between rows, with the header row repeated. Body text is packed
+    up to `chunk_size` characters, carrying about `chunk_overlap` characters of
+    trailing lines into the next chunk of the same section.
+
+    Pages are fed one at a time with `add_page`, which yields the chunks that
+    are complete so far; `finish` yields the rest. The body font size is the
+    most common size seen so far, so no look-ahead is needed.
+    """
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.chunk_count = 0
+        self.estimated_tokens = 0
+        self._font_chars: Counter = Counter()
+        self._sections: List[Tuple[float, str]] = []
+        self._lines: List[Tuple[str, int, bool]] = []  # (text, page, is table row)
+        self._length = 0
+        self._table: List[Tuple[str, int]] = []
+        self._long_line_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    @property
+    def section_path(self) -> str:
+        return SECTION_SEPARATOR.join(title for _, title in self._sections)
+
+    @property
+    def _budget(self) -> int:
+        """Characters left for the body once the section path prefix is counted."""
+        return max(self.chunk_size - len(self.section_path) - 1, self.chunk_size // 2)
+
+    def add_page(self, page: int, lines: Iterable[LayoutLine]) -> Iterator[Document]:
+        lines = [line for line in lines if line.text.strip()]
+        for line in lines:
+            if line.size:
+                self._font_chars[round(line.size * 2) / 2] += len(line.text)
+        body_size = self._font_chars.most_common(1)[0][0] if self._font_chars else None
+
+        for line in lines:
+            text = line.text.strip()
+            if line.is_table:
+                self._table.append((text, page))
+                continue
+            yield from self._flush_table()
+            if body_size and line.size and line.size >= body_size * HEADING_SIZE_RATIO and len(text) <= MAX_HEADING_CHARS:
+                yield from self._emit()
+                while self._sections and self._sections[-1][0] <= line.size:
+                    self._sections.pop()
+                self._sections.append((line.size, text))
+            elif len(text) > self.chunk_size:
+                for piece in self._long_line_splitter.split_text(text):
+                    yield from self._add_text(piece, page)
+            else:
+                yield from self._add_text(text, page)
+
+    def finish(self) -> Iterator[Document]:
+        yield from self._flush_table()
+        yield from self._emit()
+
+    def split(self, pages: Iterable[Tuple[int, Iterable[LayoutLine]]]) -> Iterator[Document]:
+        for page, lines in pages:
+            yield from self.add_page(page, lines)
+        yield from self.finish()
+
+    def _add_text(self, text: str, page: int) -> Iterator[Document]:
+        if self._lines and self._length + len(text) + 1 > self._budget:
+            overlap = self._overlap_lines()
+            yield from self._emit()
+            self._lines = overlap
+            self._length = sum(len(line) + 1 for line, _, _ in overlap)
+        self._lines.append((text, page, False))
+        self._length += len(text) + 1
+
+    def _overlap_lines(self) -> List[Tuple[str, int, bool]]:
+        overlap, length = [], 0
+        for line in reversed(self._lines):
+            if line[2] or length + len(line[0]) + 1 > self.chunk_overlap:
+                break
+            overlap.insert(0, line)
+            length += len(line[0]) + 1
+        return overlap
+
+    def _flush_table(self) -> Iterator[Document]:
+        if not self._table:
+            return
+        rows, self._table = self._table, []
+        table_length = sum(len(row) + 1 for row, _ in rows)
+        budget = self._budget
+        if self._length + table_length > budget:
+            yield from self._emit()
+        if table_length <= budget:
+            groups = [rows]
+        else:
+            header, groups, group, length = rows[0], [], [rows[0]], len(rows[0][0]) + 1
+            for row in rows[1:]:
+                if length + len(row[0]) + 1 > budget and len(group) > 1:
+                    groups.append(group)
+                    group, length = [header], len(header[0]) + 1
+                group.append(row)
+                length += len(row[0]) + 1
+            groups.append(group)
+
+        for i, group in enumerate(groups):
+            if i:
+                yield from self._emit()
+            self._lines.extend((row, page, True) for row, page in group)
+            self._length += sum(len(row) + 1 for row, _ in group)
+
+    def _emit(self) -> Iterator[Document]:
+        if not self._lines:
+            return
+        lines, self._lines, self._length = self._lines, [], 0
+        pages = [page for _, page, _ in lines]
+        path = self.section_path
+        body = "\n".join(text for text, _, _ in lines)
+        content = f"{path}\n{body}" if path else body
+        self.chunk_count += 1
+        self.estimated_tokens += estimate_tokens(content)
+        yield Document(page_content=content, metadata={
+            "page": min(pages),
+            "page_start": min(pages),
+            "page_end": max(pages),
+            "section_path": path,
+            "has_table": any(is_table for _, _, is_table in lines),
+        })
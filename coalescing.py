@@ -0,0 +1,103 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+from document_manager import DocumentManager
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Runs at most one coroutine per key at a time.
+
+    Callers arriving while a key is in flight await the same future instead of
+    starting their own work. The shared work is shielded, so one caller being
+    cancelled does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.started = 0
+        self.joined = 0
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Returns the result and whether it was shared with an earlier in-flight caller."""
+        future = self._inflight.get(key)
+        shared = future is not None
+        if shared:
+            self.joined += 1
+        else:
+            self.started += 1
+            future = asyncio.ensure_future(factory())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future), shared
+
+    async def wait(self, key: Hashable) -> bool:
+        """Waits, without joining its result or error, for work in flight under `key`. Returns whether there was any."""
+        future = self._inflight.get(key)
+        if future is None:
+            return False
+        await asyncio.wait([future])
+        return True
+
+    def stats(self) -> dict:
+        return {"started": self.started, "joined": self.joined, "in_flight": len(self._inflight)}
+
+
+@dataclass
+class _Lease:
+    future: asyncio.Future
+    refs: int = 0
+
+
+class DocumentPool:
+    """
+    Reference-counted downloads shared by concurrent requests for the same URL.
+
+    The first `acquire` for a URL starts the download. Later callers reuse the
+    in-flight or already downloaded file until the last holder calls `release`.
+    Only then is the file deleted.
+    """
+
+    def __init__(self):
+        self._leases: Dict[str, _Lease] = {}
+        self.downloads = 0
+        self.shared = 0
+
+    async def acquire(self, document_url: str) -> DocumentManager:
+        lease = self._leases.get(document_url)
+        if lease is None:
+            lease = _Lease(asyncio.ensure_future(DocumentManager.create(document_url)))
+            self._leases[document_url] = lease
+            self.downloads += 1
+        else:
+            self.shared += 1
+        lease.refs += 1
+        try:
+            return await asyncio.shield(lease.future)
+        except BaseException:
+            self._release_lease(document_url, lease)
+            raise
+
+    def release(self, document_url: str) -> None:
+        lease = self._leases.get(document_url)
+        if lease is not None:
+            self._release_lease(document_url, lease)
+
+    def _release_lease(self, document_url: str, lease: _Lease) -> None:
+        lease.refs -= 1
+        if lease.refs > 0:
+            return
+        if self._leases.get(document_url) is lease:
+            del self._leases[document_url]
+        if lease.future.done() and not lease.future.cancelled() and lease.future.exception() is None:
+            lease.future.result().cleanup()
+        elif not lease.future.done():
+            lease.future.add_done_callback(
+                lambda f: f.result().cleanup() if not f.cancelled() and f.exception() is None else None
+            )
+
+    def stats(self) -> dict:
+        return {"downloads": self.downloads, "shared": self.shared, "held": len(self._leases)}
@@ -9,5 +9,92 @@ API_AUTH_TOKEN = os.getenv("API_AUTH_TOKEN")
 EMBEDDING_MODEL = "models/embedding-001"
 ANSWER_LLM_MODEL = "gemini-2.0-flash"
 QUERY_LLM_MODEL = "gemini-2.0-flash-lite"
+GOOGLE_API_BASE_URL = os.getenv("GOOGLE_API_BASE_URL")
+
+# Shared model-call layer (llm.py). Requests and tokens per minute are per model, 0 means unlimited.
+ANSWER_LLM_RPM = int(os.getenv("ANSWER_LLM_RPM", "0"))
+ANSWER_LLM_TPM = int(os.getenv("ANSWER_LLM_TPM", "0"))
+QUERY_LLM_RPM = int(os.getenv("QUERY_LLM_RPM", "0"))
+QUERY_LLM_TPM = int(os.getenv("QUERY_LLM_TPM", "0"))
+EMBEDDING_RPM = int(os.getenv("EMBEDDING_RPM", "0"))
+EMBEDDING_TPM = int(os.getenv("EMBEDDING_TPM", "0"))
+MODEL_MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", "16"))  # in-flight calls per model
+MODEL_MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "4"))
+MODEL_BACKOFF_BASE_SECONDS = float(os.getenv("MODEL_BACKOFF_BASE_SECONDS", "0.5"))
+MODEL_BACKOFF_MAX_SECONDS = float(os.getenv("MODEL_BACKOFF_MAX_SECONDS", "20"))
+MODEL_HEDGING_ENABLED = os.getenv("MODEL_HEDGING_ENABLED", "false").lower() == "true"
+MODEL_HEDGE_PERCENTILE = float(os.getenv("MODEL_HEDGE_PERCENTILE", "95"))  # hedge calls slower than this latency percentile
+MODEL_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("MODEL_HEDGE_MIN_DELAY_SECONDS", "1.0"))
+MODEL_HEDGE_MIN_SAMPLES = int(os.getenv("MODEL_HEDGE_MIN_SAMPLES", "20"))
+MODEL_FALLBACK_ENABLED = os.getenv("MODEL_FALLBACK_ENABLED", "true").lower() == "true"  # answer with QUERY_LLM_MODEL under pressure
+MODEL_PRESSURE_WINDOW_SECONDS = float(os.getenv("MODEL_PRESSURE_WINDOW_SECONDS", "30"))
+MODEL_FALLBACK_MAX_WAIT_SECONDS = float(os.getenv("MODEL_FALLBACK_MAX_WAIT_SECONDS", "5"))
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "google")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", "1024"))
+
+MAX_DOCUMENT_BYTES = int(os.getenv("MAX_DOCUMENT_BYTES", str(100 * 1024 ** 2)))
+DOWNLOAD_TIMEOUT_SECONDS = float(os.getenv("DOWNLOAD_TIMEOUT_SECONDS", "60"))
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", str(os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+EMAIL_PROCESS_ATTACHMENTS = os.getenv("EMAIL_PROCESS_ATTACHMENTS", "true").lower() == "true"
+
+CHUNKING_STRATEGY = os.getenv("CHUNKING_STRATEGY", "layout")  # "layout" or "recursive"
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "150"))
+
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+HYBRID_CANDIDATE_MULTIPLIER = int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", "4"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+ENABLE_QUERY_DECOMPOSITION = os.getenv("ENABLE_QUERY_DECOMPOSITION", "true").lower() == "true"
+# Adaptive decomposition retrieves with the original questions first and only rewrites those whose hits look
+# unreliable: a top score below DECOMPOSITION_MIN_TOP_SCORE, or a top score less than DECOMPOSITION_MIN_SCORE_MARGIN
+# (relative) above the mean of the rest of the top-k. Both use vector similarity, also in hybrid mode. Top scores
+# depend on the embedding model and store (cosine, 1 - L2 distance for Chroma), so that threshold is off by default.
+ADAPTIVE_QUERY_DECOMPOSITION = os.getenv("ADAPTIVE_QUERY_DECOMPOSITION", "true").lower() == "true"
+DECOMPOSITION_MIN_TOP_SCORE = float(os.getenv("DECOMPOSITION_MIN_TOP_SCORE", "0"))
+DECOMPOSITION_MIN_SCORE_MARGIN = float(os.getenv("DECOMPOSITION_MIN_SCORE_MARGIN", "0.05"))
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma")
+CHROMA_MAX_COLLECTIONS = int(os.getenv("CHROMA_MAX_COLLECTIONS", "64"))
+RETRIEVAL_MAX_WORKERS = int(os.getenv("RETRIEVAL_MAX_WORKERS", "8"))
+
+INDEX_CACHE_DIR = os.getenv("INDEX_CACHE_DIR", "doc_cache")
+INDEX_CACHE_MAX_BYTES = int(os.getenv("INDEX_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+INDEX_CACHE_MAX_AGE_SECONDS = int(os.getenv("INDEX_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+
+GENERATION_MAX_CONTEXT_TOKENS = int(os.getenv("GENERATION_MAX_CONTEXT_TOKENS", "12000"))
+GENERATION_MAX_QUESTIONS_PER_BATCH = int(os.getenv("GENERATION_MAX_QUESTIONS_PER_BATCH", "8"))
+GENERATION_MAX_PARALLEL = int(os.getenv("GENERATION_MAX_PARALLEL", "4"))
+
+CONTEXT_COMPRESSION_ENABLED = os.getenv("CONTEXT_COMPRESSION_ENABLED", "true").lower() == "true"
+CONTEXT_COMPRESSION_TOKENS_PER_QUESTION = int(os.getenv("CONTEXT_COMPRESSION_TOKENS_PER_QUESTION", "500"))
+CONTEXT_COMPRESSION_MAX_TOKENS = int(os.getenv("CONTEXT_COMPRESSION_MAX_TOKENS", "6000"))
+CONTEXT_COMPRESSION_MIN_RELATIVE_SCORE = float(os.getenv("CONTEXT_COMPRESSION_MIN_RELATIVE_SCORE", "0.6"))
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+# Near-duplicate matching is off by default: it costs an embedding call on every miss and store, and a negated
+# question can embed close to the original. Set a cosine threshold such as 0.95 to serve near-duplicates too.
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0"))
+
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+INGESTION_QUEUE_MAX_SIZE = int(os.getenv("INGESTION_QUEUE_MAX_SIZE", "1000"))
+INGESTION_MAX_TRACKED = int(os.getenv("INGESTION_MAX_TRACKED", "10000"))  # finished jobs beyond this are forgotten, oldest first
+
+STARTUP_MODE = os.getenv("STARTUP_MODE", "eager")  # "eager" builds clients in the lifespan hook, "lazy" on the first request
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "false").lower() == "true"
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+
 if not GOOGLE_API_KEY:
     raise ValueError("GOOGLE_API_KEY must be set in the .env file.")
\ No newline at end of file
@@ -0,0 +1,244 @@
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+from langchain_core.documents import Document
+
+from batch_planner import chunk_key, estimate_tokens
+from chunker import is_table_line
+from embeddings import EmbeddingBackend, HashingEmbeddings
+from config import CONTEXT_COMPRESSION_TOKENS_PER_QUESTION, CONTEXT_COMPRESSION_MAX_TOKENS, CONTEXT_COMPRESSION_MIN_RELATIVE_SCORE
+
+_SECTION_MARKERS = frozenset(("### Text Content ###", "### Table Content ###"))
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?;])\s+(?=[\"'(\[A-Z0-9])")
+_SPACE_RE = re.compile(r"\s+")
+# Weight of the whole chunk's similarity in a unit's score. The chunk carries context a
+# single sentence or table row lacks, such as which section it belongs to.
+_CHUNK_WEIGHT = 0.5
+# Sentences are split above half a question's budget, but never into pieces smaller than this.
+_MIN_SPLIT_TOKENS = 32
+
+_local_embeddings: Optional[HashingEmbeddings] = None
+
+
+@dataclass
+class _Unit:
+    document: int
+    text: str
+    key: str
+    table_header: Optional[int] = None  # index of the header row of the table this row belongs to
+
+
+def _split_long(text: str, max_tokens: int) -> List[str]:
+    """Splits text over `max_tokens` at word boundaries, so a run-on sentence cannot outgrow every budget."""
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    pieces, current = [], []
+    for word in text.split():
+        if current and estimate_tokens(" ".join(current + [word])) > max_tokens:
+            pieces.append(" ".join(current))
+            current = []
+        current.append(word)
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def _split_units(index: int, doc: Document, units: List[_Unit], max_unit_tokens: int) -> Optional[str]:
+    """
+    Appends the sentences and table rows of `doc` to `units`, splitting sentences over
+    `max_unit_tokens`, and returns its section heading if it has one.
+    """
+    lines = [line.strip() for line in doc.page_content.splitlines()]
+    lines = [line for line in lines if line and line not in _SECTION_MARKERS]
+    heading = doc.metadata.get("section_path") or None
+    if heading and lines and lines[0] == heading:
+        lines = lines[1:]
+
+    prose: List[str] = []
+    table_header: Optional[int] = None
+
+    def flush_prose():
+        for sentence in _SENTENCE_END_RE.split(" ".join(prose)):
+            for piece in _split_long(sentence, max_unit_tokens):
+                units.append(_Unit(index, piece, _SPACE_RE.sub(" ", piece).lower()))
+        prose.clear()
+
+    for line in lines:
+        if is_table_line(line):
+            if prose:
+                flush_prose()
+            if table_header is None:
+                table_header = len(units)
+            units.append(_Unit(index, line, _SPACE_RE.sub(" ", line).lower(), table_header))
+        else:
+            prose.append(line)
+            table_header = None
+    if prose:
+        flush_prose()
+    return heading
+
+
+def _deduplicate(units: List[_Unit], boundary: Set[int]) -> List[int]:
+    """
+    Returns the indexes of the units to keep: drops exact repeats, then units at a
+    chunk edge that are contained in another unit, which chunk overlap leaves behind.
+    Table header rows are always kept, since a table split across chunks repeats
+    its header and each part needs its own copy.
+    """
+    first: Dict[str, int] = {}
+    for i, unit in enumerate(units):
+        first.setdefault(unit.key, i)
+    blob = "\n".join(first)
+    return [
+        i for i, unit in enumerate(units)
+        if unit.table_header == i or (first[unit.key] == i and not (i in boundary and blob.count(unit.key) > 1))
+    ]
+
+
+def compress_documents(
+    questions: List[str],
+    documents: List[Document],
+    embeddings: Optional[EmbeddingBackend] = None,
+    tokens_per_question: int = CONTEXT_COMPRESSION_TOKENS_PER_QUESTION,
+    max_tokens: int = CONTEXT_COMPRESSION_MAX_TOKENS,
+    min_relative_score: float = CONTEXT_COMPRESSION_MIN_RELATIVE_SCORE,
+    question_documents: Optional[List[List[Document]]] = None,
+) -> List[Document]:
+    """
+    Extractive compression of retrieved chunks for one generation call.
+
+    Chunks are split into sentences and table rows, deduplicated across chunks,
+    and scored against every question by cosine similarity, blended with the
+    similarity of the chunk they come from, in one matrix product per level
+    (local hashing embeddings by default, so no API calls). Units are
+    then taken round-robin in each question's rank order, each question spending
+    at most `tokens_per_question` and all of them together at most `max_tokens`;
+    a unit scoring below `min_relative_score` times the question's best is skipped.
+    Each question's best unit is kept whatever the budgets, and sentences longer
+    than half a question's budget are split first. A selected table row brings its
+    header row, and each chunk keeps its section heading. Returns one document per
+    chunk that kept anything, with the units in their original order.
+
+    The local embeddings only see shared words, so a question that matches no unit
+    at all (a paraphrase, say) gets whole chunks instead, in the order the retriever
+    ranked them for it (`question_documents`, each question's chunks best first;
+    batch order without it), under the same budgets. Its top chunk is kept whatever
+    the budgets.
+    """
+    global _local_embeddings
+    if not questions or not documents:
+        return documents
+    if embeddings is None:
+        _local_embeddings = _local_embeddings or HashingEmbeddings()
+        embeddings = _local_embeddings
+
+    units: List[_Unit] = []
+    headings: List[Optional[str]] = []
+    boundary: Set[int] = set()
+    for index, doc in enumerate(documents):
+        start = len(units)
+        headings.append(_split_units(index, doc, units, max(tokens_per_question // 2, _MIN_SPLIT_TOKENS)))
+        if len(units) > start:
+            boundary.update((start, len(units) - 1))
+    keep = _deduplicate(units, boundary)
+    if not keep:
+        return documents
+    position = {original: i for i, original in enumerate(keep)}
+    units = [units[i] for i in keep]
+
+    texts = []
+    for unit in units:
+        header = units[position[unit.table_header]].text if unit.table_header not in (None, keep[len(texts)]) else None
+        texts.append("\n".join(part for part in (headings[unit.document], header, unit.text) if part))
+    unit_vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    chunk_vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in documents]), dtype=np.float32)
+    question_vectors = np.asarray(embeddings.embed_queries(questions), dtype=np.float32)
+    chunk_scores = question_vectors @ chunk_vectors.T
+    document_of = np.fromiter((unit.document for unit in units), dtype=np.int64, count=len(units))
+    scores = (1 - _CHUNK_WEIGHT) * (question_vectors @ unit_vectors.T) + _CHUNK_WEIGHT * chunk_scores[:, document_of]
+    best = scores.max(axis=1)
+    rankings = np.argsort(-scores, axis=1, kind="stable")
+    floors = best * min_relative_score
+    unmatched = best <= 0
+    chunk_rankings: List[List[int]] = [[] for _ in questions]
+    if unmatched.any():
+        index_of = {chunk_key(doc): i for i, doc in enumerate(documents)}
+        for q in np.flatnonzero(unmatched):
+            ranked = question_documents[q] if question_documents else documents
+            chunk_rankings[q] = list(dict.fromkeys(index_of[chunk_key(doc)] for doc in ranked if chunk_key(doc) in index_of))
+
+    selected: Set[int] = set()
+    whole: Set[int] = set()
+    used_headings: Set[int] = set()
+    spent = [0] * len(questions)
+    total = 0
+
+    def take_chunk(q: int, index: int, within_budget: bool) -> None:
+        nonlocal total
+        if index in whole:
+            return
+        cost = estimate_tokens(documents[index].page_content)
+        if within_budget and (spent[q] + cost > tokens_per_question or total + cost > max_tokens):
+            return
+        whole.add(index)
+        spent[q] += cost
+        total += cost
+
+    def take(q: int, u: int, within_budget: bool) -> None:
+        nonlocal total
+        unit = units[u]
+        if unit.document in whole:
+            return
+        extra = [u]
+        if unit.table_header is not None:
+            header = position.get(unit.table_header)
+            if header is not None and header not in selected and header != u:
+                extra.append(header)
+        cost = sum(estimate_tokens(units[i].text) for i in extra)
+        if unit.document not in used_headings and headings[unit.document]:
+            cost += estimate_tokens(headings[unit.document])
+        if within_budget and (spent[q] + cost > tokens_per_question or total + cost > max_tokens):
+            return
+        selected.update(extra)
+        used_headings.add(unit.document)
+        spent[q] += cost
+        total += cost
+
+    for q in range(len(questions)):
+        if unmatched[q]:
+            if chunk_rankings[q]:
+                take_chunk(q, chunk_rankings[q][0], within_budget=False)
+            continue
+        u = int(rankings[q, 0])
+        if u not in selected:
+            take(q, u, within_budget=False)
+    for rank in range(1, max([len(units)] + [len(ranked) for ranked in chunk_rankings])):
+        for q in range(len(questions)):
+            if unmatched[q]:
+                if rank < len(chunk_rankings[q]):
+                    take_chunk(q, chunk_rankings[q][rank], within_budget=True)
+                continue
+            if rank >= len(units):
+                continue
+            u = int(rankings[q, rank])
+            if u not in selected and scores[q, u] > floors[q]:
+                take(q, u, within_budget=True)
+
+    kept: Dict[int, List[_Unit]] = {index: [] for index in whole}
+    for i in sorted(selected):
+        if units[i].document not in whole:
+            kept.setdefault(units[i].document, []).append(units[i])
+    compressed = []
+    for index, doc_units in sorted(kept.items()):
+        if index in whole:
+            compressed.append(documents[index])
+            continue
+        body = "\n".join(unit.text for unit in doc_units)
+        heading = headings[index]
+        original = documents[index]
+        compressed.append(Document(
+            id=original.id, page_content=f"{heading}\n{body}" if heading else body, metadata=original.metadata,
+        ))
+    return compressed
@@ -1,36 +1,100 @@
+import asyncio
+import hashlib
 import os
+import tempfile
 import uuid
-import requests
-from typing import Tuple
-import shelve
+import httpx
+from typing import Optional, Tuple
+import metrics
+from loaders import detect_file_extension
+from config import MAX_DOCUMENT_BYTES, DOWNLOAD_TIMEOUT_SECONDS, DOWNLOAD_CHUNK_SIZE
+
+
+class DocumentTooLargeError(ValueError):
+    pass
+
 
 class DocumentManager:
-    DIR = 'doc_cache'
+    DIR = os.path.join(tempfile.gettempdir(), 'doc_downloads')
+    SNIFF_BYTES = 512
+    _client: Optional[httpx.AsyncClient] = None
+    _client_loop: Optional[asyncio.AbstractEventLoop] = None
 
     def __init__(self, document_url: str):
-        self.document_url = document_url
-        self.file_path, self.filename = self._download_document()
-        self.DIR = 'doc_cache'
         os.makedirs(self.DIR, exist_ok=True)
         self.document_url = document_url
-        self.file_path, self.file_extension = self._download_document()
+        self.file_path = None
+        self.file_extension = None
+        self.content_hash = None
+
+    @classmethod
+    async def create(cls, document_url: str) -> "DocumentManager":
+        manager = cls(document_url)
+        with metrics.span("download"):
+            manager.file_path, manager.file_extension, manager.content_hash = await manager._download_document()
+        return manager
 
+    @classmethod
+    def get_http_client(cls) -> httpx.AsyncClient:
+        """Returns the pooled keep-alive client shared by all downloads on the running event loop."""
+        loop = asyncio.get_running_loop()
+        if cls._client is None or cls._client.is_closed or cls._client_loop is not loop:
+            cls._client = httpx.AsyncClient(
+                timeout=DOWNLOAD_TIMEOUT_SECONDS,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            )
+            cls._client_loop = loop
+        return cls._client
 
-    def _download_document(self) -> Tuple[str,str]:
-        response = requests.get(str(self.document_url), timeout=60)
-        response.raise_for_status()
-        filename = uuid.uuid4()
-        file_path = os.path.join(self.DIR, f"{filename}.pdf")
-        with open(file_path, "wb") as f:
-            f.write(response.content)
-        return file_path,'f{filename}' 
+    @classmethod
+    async def aclose_http_client(cls):
+        if cls._client is not None and not cls._client.is_closed:
+            await cls._client.aclose()
+        cls._client = None
+
+    async def _download_document(self) -> Tuple[str, str, str]:
+        url = str(self.document_url)
+        fd, part_path = tempfile.mkstemp(dir=self.DIR, suffix=".part")
+        hasher, size, head = hashlib.sha256(), 0, b""
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async with self.get_http_client().stream("GET", url) as response:
+                    response.raise_for_status()
+                    declared_size = int(response.headers.get("Content-Length") or 0)
+                    if declared_size > MAX_DOCUMENT_BYTES:
+                        raise DocumentTooLargeError(f"Document is {declared_size} bytes, limit is {MAX_DOCUMENT_BYTES}.")
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > MAX_DOCUMENT_BYTES:
+                            raise DocumentTooLargeError(f"Document exceeds the {MAX_DOCUMENT_BYTES}-byte limit.")
+                        if len(head) < self.SNIFF_BYTES:
+                            head += chunk[:self.SNIFF_BYTES - len(head)]
+                        hasher.update(chunk)
+                        f.write(chunk)
+                    content_type = response.headers.get("Content-Type", "")
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+
+        file_extension = detect_file_extension(head, content_type, url, part_path)
+        file_path = os.path.join(self.DIR, f"{uuid.uuid4()}{file_extension}")
+        os.replace(part_path, file_path)
+        return file_path, file_extension, hasher.hexdigest()
 
     def get_filepath(self) -> str:
         return self.file_path
     
     def get_filename(self) ->str:
-        return self.filename
+        return os.path.basename(self.file_path)
+
+    def get_file_extension(self) -> str:
+        return self.file_extension
+
+    def get_content_hash(self) -> str:
+        return self.content_hash
 
     def cleanup(self):
         if getattr(self, 'file_path', None) and os.path.exists(self.file_path):
-            os.remove(self.file_path)
+            os.remove(self.file_path)
\ No newline at end of file
@@ -1,41 +1,70 @@
-import docx2txt
 import os
+from typing import Iterator, List, Tuple
 from langchain_core.documents import Document
+from chunker import LayoutLine
+from loaders import DocumentLoader
 
-class DocxLoader:
+BODY_FONT_SIZE = 11.0
+
+
+class DocxLoader(DocumentLoader):
     """
-    A simple loader to extract text from a .docx file.
-    It uses the docx2txt library to convert the document to plain text.
+    A loader to extract text from a .docx file.
+    It walks the document body in order with python-docx, so paragraphs and
+    table rows keep their position, and heading styles are preserved.
     """
 
-    def __init__(self, file_path: str):
-        """
-        Initializes the loader with the path to the DOCX file.
-        
-        Args:
-            file_path: The full path to the DOCX file.
+    def iter_pages(self) -> Iterator[Tuple[int, List[LayoutLine]]]:
         """
-        self.file_path = file_path
+        Yields the whole document as a single page of layout lines.
 
-    def load(self) -> list[Document]:
-        """
-        Loads the DOCX file, extracts all text, and returns a single
-        LangChain Document object.
-        
-        Returns:
-            A list containing one Document object.
+        DOCX files carry no font sizes for most text, so heading styles are given
+        sizes above the body size (Title largest, then Heading 1, 2, ...), which is
+        what the layout chunker uses to find sections. Table rows are flagged as
+        such, with cells separated by " | ".
         """
         try:
-            # docx2txt.process returns the full text content as a string
-            content = docx2txt.process(self.file_path)
-            
-            # Create and return a single Document object with the content
-            # and a minimal set of metadata.
-            metadata = {"source": os.path.basename(self.file_path)}
-            return [Document(page_content=content, metadata=metadata)]
+            import docx
+            from docx.oxml.ns import qn
+            from docx.table import Table
+            from docx.text.paragraph import Paragraph
 
+            document = docx.Document(self.file_path)
+            # Resolving `paragraph.style` scans every style per call; look names up by id instead.
+            style_names = {style.style_id: style.name for style in document.styles}
+            lines = []
+            for child in document.element.body.iterchildren():
+                if child.tag == qn("w:p"):
+                    paragraph = Paragraph(child, document)
+                    text = paragraph.text.strip()
+                    if text:
+                        lines.append(LayoutLine(text, self._font_size(style_names.get(child.style, ""))))
+                elif child.tag == qn("w:tbl"):
+                    for row in Table(child, document).rows:
+                        cells = list({id(cell._tc): cell.text.strip() for cell in row.cells}.values())
+                        if any(cells):
+                            lines.append(LayoutLine(" | ".join(cells), BODY_FONT_SIZE, is_table=True))
         except Exception as e:
             # Handle potential errors during file processing
             print(f"Error loading DOCX file {self.file_path}: {e}")
-            return []
+            return
+        if lines:
+            yield 1, lines
+
+    def iter_documents(self) -> Iterator[Document]:
+        """
+        Yields a single LangChain Document with the text of the whole file.
+        """
+        for _, lines in self.iter_pages():
+            metadata = {"source": os.path.basename(self.file_path)}
+            yield Document(page_content="\n".join(line.text for line in lines), metadata=metadata)
 
+    @staticmethod
+    def _font_size(style_name: str) -> float:
+        if style_name == "Title":
+            return BODY_FONT_SIZE + 2 * 10
+        if style_name.startswith("Heading "):
+            level = style_name.split(" ", 1)[1]
+            if level.isdigit():
+                return BODY_FONT_SIZE + 2 * (10 - int(level))
+        return BODY_FONT_SIZE
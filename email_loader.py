@@ -1,81 +1,116 @@
+import html
 import os
+import re
+from typing import Iterator, Optional
 from langchain_core.documents import Document
 from email.parser import BytesParser
 from email.policy import default
-import extract_msg
+from loaders import DocumentLoader, load_bytes
+from config import EMAIL_PROCESS_ATTACHMENTS
 
-class EmailLoader:
+MAX_ATTACHMENT_DEPTH = 2
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def _html_to_text(markup: str) -> str:
+    markup = re.sub(r"(?is)<(script|style).*?</\1>", "", markup)
+    markup = re.sub(r"(?i)<br\s*/?>|</p>|</div>|</tr>|</li>", "\n", markup)
+    return html.unescape(_TAG_RE.sub("", markup))
+
+
+class EmailLoader(DocumentLoader):
     """
     A loader to extract content from email files (.eml and .msg).
-    It extracts the subject, sender, and body of the email.
+    It extracts the subject, sender, and body of the email, then the text of any
+    attachment whose type the loader registry supports.
     """
 
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, process_attachments: bool = EMAIL_PROCESS_ATTACHMENTS, depth: int = 0):
         """
         Initializes the loader with the path to the email file.
-        
+
         Args:
             file_path: The full path to the email file.
+            process_attachments: Whether to load supported attachments as extra documents.
+            depth: How deeply this email is nested inside other emails' attachments.
         """
-        self.file_path = file_path
+        super().__init__(file_path)
         self.file_extension = os.path.splitext(self.file_path)[1].lower()
+        self.process_attachments = process_attachments and depth < MAX_ATTACHMENT_DEPTH
+        self.depth = depth
 
-    def load(self) -> list[Document]:
+    def iter_documents(self) -> Iterator[Document]:
         """
-        Loads the email file, extracts relevant information (sender, subject, body),
-        and returns a single LangChain Document object.
-        
-        Returns:
-            A list containing one Document object.
+        Yields one Document for the email itself, followed by the documents of its
+        supported attachments, loaded one at a time.
         """
         if self.file_extension == ".eml":
-            return self._load_eml()
+            yield from self._iter_eml()
         elif self.file_extension == ".msg":
-            return self._load_msg()
+            yield from self._iter_msg()
         else:
             print(f"Unsupported email file type: {self.file_path}")
-            return []
 
-    def _load_eml(self) -> list[Document]:
-        """Loads and parses a .eml file."""
+    def _email_document(self, subject: str, sender: str, body: str) -> Document:
+        content = f"Subject: {subject}\nFrom: {sender}\n\n{body}"
+        metadata = {"source": os.path.basename(self.file_path), "subject": subject, "sender": sender}
+        return Document(page_content=content, metadata=metadata)
+
+    def _iter_attachment(self, data: Optional[bytes], filename: str, content_type: str = "") -> Iterator[Document]:
+        if not data:
+            return
+        nested = {"depth": self.depth + 1}
+        try:
+            for document in load_bytes(data, filename, content_type, loader_kwargs={".eml": nested, ".msg": nested}):
+                document.metadata["attachment"] = filename
+                yield document
+        except Exception as e:
+            print(f"Error loading attachment {filename} of {self.file_path}: {e}")
+
+    def _iter_eml(self) -> Iterator[Document]:
+        """Parses a .eml file."""
         try:
             with open(self.file_path, 'rb') as fp:
                 message = BytesParser(policy=default).parse(fp)
 
             subject = message.get("Subject", "")
             sender = message.get("From", "")
+            body_part = message.get_body(preferencelist=("plain", "html"))
             body = ""
-
-            # Check if the message has a plain text part
-            if message.is_multipart():
-                for part in message.walk():
-                    if part.get_content_type() == "text/plain":
-                        body = part.get_payload(decode=True).decode(part.get_content_charset(), errors='ignore')
-                        break
-            else:
-                if message.get_content_type() == "text/plain":
-                    body = message.get_payload(decode=True).decode(message.get_content_charset(), errors='ignore')
-
-            content = f"Subject: {subject}\nFrom: {sender}\n\n{body}"
-            metadata = {"source": os.path.basename(self.file_path), "subject": subject, "sender": sender}
-            return [Document(page_content=content, metadata=metadata)]
-
+            if body_part is not None:
+                body = body_part.get_content()
+                if body_part.get_content_type() == "text/html":
+                    body = _html_to_text(body)
         except Exception as e:
             print(f"Error loading EML file {self.file_path}: {e}")
-            return []
+            return
 
-    def _load_msg(self) -> list[Document]:
-        """Loads and parses a .msg file using extract-msg."""
-        try:
-            with extract_msg.Message(self.file_path) as msg:
-                subject = msg.subject
-                sender = msg.sender
-                body = msg.body
+        yield self._email_document(subject, sender, body)
+        if self.process_attachments:
+            for part in message.iter_attachments():
+                if part.get_content_type() == "message/rfc822":
+                    data = bytes(part.get_content())
+                else:
+                    data = part.get_payload(decode=True)
+                yield from self._iter_attachment(data, part.get_filename() or "", part.get_content_type())
 
-                content = f"Subject: {subject}\nFrom: {sender}\n\n{body}"
-                metadata = {"source": os.path.basename(self.file_path), "subject": subject, "sender": sender}
-                return [Document(page_content=content, metadata=metadata)]
+    def _iter_msg(self) -> Iterator[Document]:
+        """Parses a .msg file using extract-msg."""
+        try:
+            import extract_msg
 
+            with extract_msg.Message(self.file_path) as msg:
+                subject = msg.subject or ""
+                sender = msg.sender or ""
+                body = msg.body or ""
+                attachments = [
+                    (attachment.data, attachment.longFilename or attachment.shortFilename or "")
+                    for attachment in msg.attachments if isinstance(attachment.data, bytes)
+                ] if self.process_attachments else []
         except Exception as e:
             print(f"Error loading MSG file {self.file_path}: {e}")
-            return []
+            return
+
+        yield self._email_document(subject, sender, body)
+        for data, filename in attachments:
+            yield from self._iter_attachment(data, filename)
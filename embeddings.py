@@ -0,0 +1,238 @@
+import asyncio
+import hashlib
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from batch_planner import estimate_tokens
+from llm import call_model, call_model_sync
+from config import (
+    EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_CONCURRENCY,
+    EMBEDDING_CACHE_MAX_ENTRIES, LOCAL_EMBEDDING_DIM, GOOGLE_API_BASE_URL,
+)
+
+_TOKEN_RE = re.compile(r"\w+")
+_STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+
+class EmbeddingBackend(Embeddings):
+    """
+    Base class for the embedding backends used by the application.
+
+    Adds a stable `model_name` (used in cache keys) and batched query embedding,
+    which LangChain's interface only offers one query at a time.
+    """
+    model_name: str = "unknown"
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_queries, texts)
+
+
+class HashingEmbeddings(EmbeddingBackend):
+    """
+    Offline, CPU-only embeddings from signed feature hashing of unigrams and bigrams.
+
+    Term counts are log-scaled and L2-normalised. There is no fitted IDF, so a
+    vector only depends on its own text and stays valid across documents and caches.
+    """
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM):
+        self.dim = dim
+        self.model_name = f"local-hashing-{dim}"
+
+    def _embed(self, text: str) -> List[float]:
+        tokens = _TOKEN_RE.findall(text.lower())
+        features = [t for t in tokens if t not in _STOP_WORDS] + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if features:
+            hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(vector, (hashes % self.dim).astype(np.int64), signs)
+            vector = np.sign(vector) * np.log1p(np.abs(vector))
+            norm = np.linalg.norm(vector)
+            if norm:
+                vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class RemoteEmbeddings(EmbeddingBackend):
+    """
+    Wraps a remote LangChain embeddings client, splitting large inputs into batches
+    of `batch_size` and sending at most `max_concurrency` batches at once.
+    """
+
+    def __init__(self, client: Embeddings, model_name: str, batch_size: int = EMBEDDING_BATCH_SIZE,
+                 max_concurrency: int = EMBEDDING_MAX_CONCURRENCY, query_kwargs: Optional[dict] = None):
+        self.client = client
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.query_kwargs = query_kwargs or {}
+
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        return [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+    async def _agather(self, texts: List[str], **kwargs) -> List[List[float]]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def embed_batch(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await call_model(
+                    self.model_name, lambda _: self.client.aembed_documents(batch, **kwargs), tokens=sum(estimate_tokens(t) for t in batch),
+                )
+
+        results = await asyncio.gather(*(embed_batch(batch) for batch in self._batches(texts)))
+        return [vector for batch in results for vector in batch]
+
+    def _embed_batch_sync(self, batch: List[str], **kwargs) -> List[List[float]]:
+        return call_model_sync(
+            self.model_name, lambda _: self.client.embed_documents(batch, **kwargs), tokens=sum(estimate_tokens(t) for t in batch),
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [vector for batch in self._batches(texts) for vector in self._embed_batch_sync(batch)]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._agather(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return call_model_sync(self.model_name, lambda _: self.client.embed_query(text), tokens=estimate_tokens(text))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await call_model(self.model_name, lambda _: self.client.aembed_query(text), tokens=estimate_tokens(text))
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return [vector for batch in self._batches(texts) for vector in self._embed_batch_sync(batch, **self.query_kwargs)]
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        return await self._agather(texts, **self.query_kwargs)
+
+
+class CachedEmbeddings(EmbeddingBackend):
+    """
+    An LRU cache in front of another backend, keyed by a hash of the text.
+
+    The cache is shared by every document processed in this process, so boilerplate
+    clauses repeated across policies are embedded once. Duplicate texts within a
+    single call are also embedded only once.
+    """
+
+    def __init__(self, backend: EmbeddingBackend, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.backend = backend
+        self.model_name = backend.model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[bytes, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(kind: str, text: str) -> bytes:
+        return hashlib.sha256(f"{kind}\0{text}".encode("utf-8")).digest()
+
+    def _lookup(self, kind: str, texts: List[str]):
+        found: Dict[int, List[float]] = {}
+        missing: Dict[bytes, str] = {}
+        keys = [self._key(kind, text) for text in texts]
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._cache.get(key)
+                if vector is not None:
+                    self._cache.move_to_end(key)
+                    found[i] = vector
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, texts[i])
+                    self.misses += 1
+        return keys, found, missing
+
+    def _store(self, missing: Dict[bytes, str], vectors: List[List[float]]) -> Dict[bytes, List[float]]:
+        computed = dict(zip(missing.keys(), vectors))
+        with self._lock:
+            self._cache.update(computed)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return computed
+
+    @staticmethod
+    def _assemble(keys, found, computed) -> List[List[float]]:
+        return [found[i] if i in found else computed[key] for i, key in enumerate(keys)]
+
+    def _embed(self, kind: str, texts: List[str], embed) -> List[List[float]]:
+        keys, found, missing = self._lookup(kind, texts)
+        computed = self._store(missing, embed(list(missing.values()))) if missing else {}
+        return self._assemble(keys, found, computed)
+
+    async def _aembed(self, kind: str, texts: List[str], aembed) -> List[List[float]]:
+        keys, found, missing = self._lookup(kind, texts)
+        computed = self._store(missing, await aembed(list(missing.values()))) if missing else {}
+        return self._assemble(keys, found, computed)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed("document", texts, self.backend.embed_documents)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._aembed("document", texts, self.backend.aembed_documents)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self._embed("query", texts, self.backend.embed_queries)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        return await self._aembed("query", texts, self.backend.aembed_queries)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_queries([text]))[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._cache),
+            }
+
+
+def create_embedding_backend(backend: str = EMBEDDING_BACKEND) -> EmbeddingBackend:
+    if backend == "local":
+        return HashingEmbeddings()
+    if backend == "google":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        # retry=None turns off the SDK's own retries in releases built on google-api-core (google-genai based ones
+        # never retry unless asked to); call_model retries with backoff instead.
+        client = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL, base_url=GOOGLE_API_BASE_URL, request_options={"retry": None})
+        return RemoteEmbeddings(client, EMBEDDING_MODEL, query_kwargs={"task_type": "RETRIEVAL_QUERY"})
+    raise ValueError(f"Unsupported embedding backend: {backend}")
+
+
+_embedding_model: Optional[CachedEmbeddings] = None
+_embedding_model_lock = threading.Lock()
+
+
+def get_embedding_model() -> CachedEmbeddings:
+    """Returns the process-wide cached embedding model for the configured backend."""
+    global _embedding_model
+    with _embedding_model_lock:
+        if _embedding_model is None:
+            _embedding_model = CachedEmbeddings(create_embedding_backend())
+        return _embedding_model
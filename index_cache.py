@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from config import INDEX_CACHE_DIR, INDEX_CACHE_MAX_BYTES, INDEX_CACHE_MAX_AGE_SECONDS, EMBEDDING_MODEL
+
+
+class IndexCache:
+    """
+    A persistent, content-addressed cache of split chunks and their embeddings.
+
+    Each entry lives in its own directory under `root`, named after a key derived
+    from the document URL, the SHA-256 of the downloaded bytes and the embedding
+    model. Entries are evicted when they exceed `max_age_seconds` or, least
+    recently used first, when the cache grows beyond `max_bytes`.
+    """
+    CHUNKS_FILE = "chunks.json"
+    EMBEDDINGS_FILE = "embeddings.npy"
+    META_FILE = "meta.json"
+
+    def __init__(
+        self,
+        root: str = INDEX_CACHE_DIR,
+        max_bytes: int = INDEX_CACHE_MAX_BYTES,
+        max_age_seconds: int = INDEX_CACHE_MAX_AGE_SECONDS,
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def make_key(document_url: str, content_hash: str, embedding_model: str = EMBEDDING_MODEL) -> str:
+        return hashlib.sha256(f"{document_url}\n{content_hash}\n{embedding_model}".encode("utf-8")).hexdigest()
+
+    def entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def get(self, key: str, mmap: bool = False) -> Optional[Tuple[List[Document], np.ndarray]]:
+        entry = self.entry_dir(key)
+        with self._lock:
+            meta = self._read_meta(entry)
+            if meta is None or self._is_expired(meta):
+                if meta is not None:
+                    self._remove(entry)
+                self.misses += 1
+                return None
+            try:
+                with open(os.path.join(entry, self.CHUNKS_FILE), "r", encoding="utf-8") as f:
+                    chunks = json.load(f)
+                embeddings = np.load(os.path.join(entry, self.EMBEDDINGS_FILE), mmap_mode="r" if mmap else None)
+            except (OSError, ValueError):
+                self._remove(entry)
+                self.misses += 1
+                return None
+            meta["last_access"] = time.time()
+            self._write_meta(entry, meta)
+            self.hits += 1
+
+        documents = [Document(id=c["metadata"].get("chunk_id"), page_content=c["page_content"], metadata=c["metadata"]) for c in chunks]
+        return documents, embeddings
+
+    def put(self, key: str, documents: List[Document], embeddings, **extra_meta) -> None:
+        tmp_dir = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        try:
+            chunks = [{"page_content": d.page_content, "metadata": d.metadata} for d in documents]
+            with open(os.path.join(tmp_dir, self.CHUNKS_FILE), "w", encoding="utf-8") as f:
+                json.dump(chunks, f)
+            np.save(os.path.join(tmp_dir, self.EMBEDDINGS_FILE), np.asarray(embeddings, dtype=np.float32))
+
+            now = time.time()
+            size_bytes = sum(os.path.getsize(os.path.join(tmp_dir, name)) for name in os.listdir(tmp_dir))
+            meta = {"created_at": now, "last_access": now, "size_bytes": size_bytes, "chunks": len(chunks), **extra_meta}
+            self._write_meta(tmp_dir, meta)
+
+            with self._lock:
+                entry = self.entry_dir(key)
+                if os.path.exists(entry):
+                    self._remove(entry)
+                os.replace(tmp_dir, entry)
+        finally:
+            if os.path.exists(tmp_dir):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict()
+
+    def evict(self) -> int:
+        """Removes expired entries, then least recently used ones until the cache fits in `max_bytes`."""
+        removed = 0
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.root):
+                entry = os.path.join(self.root, name)
+                meta = self._read_meta(entry)
+                if meta is None:
+                    continue
+                if self._is_expired(meta):
+                    self._remove(entry)
+                    removed += 1
+                else:
+                    entries.append((meta.get("last_access", 0), meta.get("size_bytes", 0), entry))
+
+            total_bytes = sum(size for _, size, _ in entries)
+            for _, size, entry in sorted(entries):
+                if total_bytes <= self.max_bytes:
+                    break
+                self._remove(entry)
+                total_bytes -= size
+                removed += 1
+            self.evictions += removed
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            metas = [m for m in (self._read_meta(os.path.join(self.root, n)) for n in os.listdir(self.root)) if m]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(metas),
+                "size_bytes": sum(m.get("size_bytes", 0) for m in metas),
+            }
+
+    def _is_expired(self, meta: dict) -> bool:
+        return time.time() - meta.get("created_at", 0) > self.max_age_seconds
+
+    def _read_meta(self, entry: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(entry, self.META_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, entry: str, meta: dict) -> None:
+        with open(os.path.join(entry, self.META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    def _remove(self, entry: str) -> None:
+        shutil.rmtree(entry, ignore_errors=True)
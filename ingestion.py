@@ -0,0 +1,108 @@
+import asyncio
+import contextvars
+import time
+import traceback
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import httpx
+from rich import print as rprint
+
+from models import DocumentStatus
+from config import INGESTION_WORKERS, INGESTION_QUEUE_MAX_SIZE, INGESTION_MAX_TRACKED
+
+
+class IngestionQueueFull(Exception):
+    pass
+
+
+class IngestionQueue:
+    """
+    A background worker pool that builds document indexes ahead of the questions.
+
+    `submit` queues a URL and returns its status, which moves through queued,
+    indexing and then ready or failed. `ingest(url)` does the work and returns
+    the document hash and chunk count. A URL that is already queued or indexing
+    is not queued twice. Workers start with the first submission, on the
+    running event loop, in an empty context so they do not inherit the
+    submitting request's context variables (such as its Server-Timing spans).
+    """
+
+    def __init__(
+        self,
+        ingest: Callable[[str], Awaitable[Tuple[str, int]]],
+        workers: int = INGESTION_WORKERS,
+        max_queue_size: int = INGESTION_QUEUE_MAX_SIZE,
+        max_tracked: int = INGESTION_MAX_TRACKED,
+    ):
+        self.ingest = ingest
+        self.workers = workers
+        self.max_tracked = max_tracked
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._tasks: List[asyncio.Task] = []
+        self._jobs: "OrderedDict[str, DocumentStatus]" = OrderedDict()
+
+    def submit(self, document_url: str) -> DocumentStatus:
+        job = self._jobs.get(document_url)
+        if job is not None and job.status in ("queued", "indexing"):
+            return job
+        self._start_workers()
+        job = DocumentStatus(document_url=document_url, status="queued", queued_at=time.time())
+        try:
+            self._queue.put_nowait(document_url)
+        except asyncio.QueueFull:
+            raise IngestionQueueFull(f"The ingestion queue is full ({self._queue.maxsize} documents)")
+        self._jobs.pop(document_url, None)
+        self._jobs[document_url] = job
+        self._forget_finished()
+        return job
+
+    def status(self, document_url: str) -> Optional[DocumentStatus]:
+        return self._jobs.get(document_url)
+
+    def statuses(self) -> List[DocumentStatus]:
+        return list(self._jobs.values())
+
+    def stats(self) -> dict:
+        counts = {"queued": 0, "indexing": 0, "ready": 0, "failed": 0}
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        return {**counts, "workers": len(self._tasks)}
+
+    async def aclose(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _start_workers(self) -> None:
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._worker(), context=contextvars.Context()) for _ in range(self.workers)
+            ]
+
+    async def _worker(self) -> None:
+        while True:
+            document_url = await self._queue.get()
+            job = self._jobs.get(document_url)
+            try:
+                if job is None or job.status != "queued":
+                    continue
+                job.status, job.started_at = "indexing", time.time()
+                try:
+                    job.document_hash, job.chunks = await self.ingest(document_url)
+                    job.status = "ready"
+                except (httpx.HTTPError, ValueError) as e:
+                    job.status, job.error = "failed", str(e) or type(e).__name__
+                    rprint(f"[bold red]Ingestion of {document_url} failed:[/bold red] {job.error}")
+                except Exception:
+                    job.status, job.error = "failed", "An internal server error occurred."
+                    rprint(f"[bold red]Ingestion of {document_url} failed:[/bold red]\n{traceback.format_exc()}")
+                job.finished_at = time.time()
+            finally:
+                self._queue.task_done()
+
+    def _forget_finished(self) -> None:
+        excess = len(self._jobs) - self.max_tracked
+        for document_url in [url for url, job in self._jobs.items() if job.status in ("ready", "failed")][:max(0, excess)]:
+            del self._jobs[document_url]
@@ -0,0 +1,422 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+import metrics
+from config import (
+    GOOGLE_API_KEY, GOOGLE_API_BASE_URL, ANSWER_LLM_MODEL, QUERY_LLM_MODEL, EMBEDDING_MODEL,
+    ANSWER_LLM_RPM, ANSWER_LLM_TPM, QUERY_LLM_RPM, QUERY_LLM_TPM, EMBEDDING_RPM, EMBEDDING_TPM,
+    MODEL_MAX_CONCURRENCY, MODEL_MAX_RETRIES, MODEL_BACKOFF_BASE_SECONDS, MODEL_BACKOFF_MAX_SECONDS,
+    MODEL_HEDGING_ENABLED, MODEL_HEDGE_PERCENTILE, MODEL_HEDGE_MIN_DELAY_SECONDS, MODEL_HEDGE_MIN_SAMPLES,
+    MODEL_FALLBACK_ENABLED, MODEL_PRESSURE_WINDOW_SECONDS, MODEL_FALLBACK_MAX_WAIT_SECONDS,
+)
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = frozenset((408, 429, 500, 502, 503, 504))
+BURST_SECONDS = 5.0  # how much of a per-minute quota may be spent at once
+_RETRY_DELAY_RE = re.compile(r"retry_?delay\D{0,20}?(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+
+class ModelOverloadedError(Exception):
+    """A model kept rate limiting after every retry; callers should back off for `retry_after` seconds."""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Model {model} is rate limited; retry after {retry_after:.1f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+def create_chat_model(model: str) -> "BaseChatModel":
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    # max_retries=1 turns off the SDK's own retries; call_model retries with backoff instead.
+    return ChatGoogleGenerativeAI(model=model, api_key=GOOGLE_API_KEY, base_url=GOOGLE_API_BASE_URL, temperature=0, max_retries=1)
+
+
+_chat_models: Dict[str, "BaseChatModel"] = {}
+_chat_models_lock = threading.Lock()
+
+
+def get_chat_model(model: str) -> "BaseChatModel":
+    """Returns the process-wide chat client for `model`, created (and its SDK imported) on first use."""
+    with _chat_models_lock:
+        if model not in _chat_models:
+            _chat_models[model] = create_chat_model(model)
+        return _chat_models[model]
+
+
+class TokenBucket:
+    """
+    Refills `rate` units per second up to `capacity`. `reserve` takes units
+    immediately, going into debt if needed, and returns how long the caller must
+    wait for its share, so waiters are served in arrival order without a lock
+    held across awaits. A rate of 0 means unlimited.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def projected_wait(self, amount: float = 1.0) -> float:
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (min(amount, self.capacity) - self.tokens) / self.rate)
+
+
+class ConcurrencyLimiter:
+    """
+    Caps in-flight calls across coroutines, on any event loop, and blocking
+    threads alike, so sync and async callers of one model share a single limit.
+    Use `async with` from coroutines and `with` from threads. A released slot is
+    handed straight to the longest waiter.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self._lock = threading.Lock()
+        self._waiters: deque = deque()  # threading.Event for threads, (loop, future) for coroutines
+
+    def _take(self) -> bool:
+        if self.in_use < self.limit and not self._waiters:
+            self.in_use += 1
+            return True
+        return False
+
+    def acquire_sync(self) -> None:
+        with self._lock:
+            if self._take():
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        event.wait()
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._take():
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # The slot was handed over as the wait was cancelled; pass it on.
+            self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                loop, future = waiter
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(_wake, future)
+                    return
+            self.in_use -= 1
+
+    def __enter__(self):
+        self.acquire_sync()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+        return False
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+        return False
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def _per_minute_bucket(per_minute: int) -> TokenBucket:
+    rate = per_minute / 60
+    return TokenBucket(rate, max(1.0, rate * BURST_SECONDS))
+
+
+class ModelGate:
+    """
+    Admission control for one model: request and token buckets, a cap on
+    in-flight calls, optional hedging of slow calls, and the counters behind
+    `model_stats()`.
+    """
+
+    def __init__(self, model: str, rpm: int = 0, tpm: int = 0, max_concurrency: int = MODEL_MAX_CONCURRENCY):
+        self.model = model
+        self.requests = _per_minute_bucket(rpm)
+        self.tokens = _per_minute_bucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.latencies: deque = deque(maxlen=200)
+        self.rate_limited_at = 0.0
+        self.counts = {"calls": 0, "retries": 0, "rate_limited": 0, "hedges": 0, "hedge_wins": 0, "fallbacks": 0, "failures": 0}
+        self.throttled_seconds = 0.0
+        self._slots = ConcurrencyLimiter(max_concurrency)
+
+    @property
+    def in_flight(self) -> int:
+        return self._slots.in_use
+
+    def count(self, event: str) -> None:
+        self.counts[event] += 1
+        metrics.record_model_event(self.model, event)
+
+    def mark_rate_limited(self) -> None:
+        self.rate_limited_at = time.monotonic()
+        self.count("rate_limited")
+
+    def under_pressure(self, tokens: int = 0) -> bool:
+        """Recently rate limited, or the buckets would make a new call wait too long."""
+        if time.monotonic() - self.rate_limited_at < MODEL_PRESSURE_WINDOW_SECONDS:
+            return True
+        wait = max(self.requests.projected_wait(), self.tokens.projected_wait(tokens))
+        return wait > MODEL_FALLBACK_MAX_WAIT_SECONDS
+
+    def hedge_delay(self) -> Optional[float]:
+        if len(self.latencies) < MODEL_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * MODEL_HEDGE_PERCENTILE / 100))
+        return max(MODEL_HEDGE_MIN_DELAY_SECONDS, ordered[index])
+
+    def _reserve(self, tokens: int) -> float:
+        """Takes this call's share of both buckets and returns how long it must wait for it."""
+        wait = max(self.requests.reserve(), self.tokens.reserve(tokens))
+        if wait:
+            self.throttled_seconds += wait
+            if metrics.enabled():
+                metrics.record("throttle", wait)
+        return wait
+
+    async def _attempt(self, invoke: Callable[[], Awaitable[T]], tokens: int) -> T:
+        wait = self._reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+        async with self._slots:
+            start = time.monotonic()
+            result = await invoke()
+            self.latencies.append(time.monotonic() - start)
+            return result
+
+    async def run(self, invoke: Callable[[], Awaitable[T]], tokens: int = 0, hedge: bool = False) -> T:
+        """
+        Runs one call. With `hedge`, a call still running after the model's usual
+        slow-call latency gets a duplicate, unless the model is under pressure, and
+        the first success wins; the other is cancelled.
+        """
+        self.count("calls")
+        delay = self.hedge_delay() if hedge else None
+        if delay is None:
+            return await self._attempt(invoke, tokens)
+
+        primary = asyncio.ensure_future(self._attempt(invoke, tokens))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or self.under_pressure(tokens):
+                return await primary
+            self.count("hedges")
+            secondary = asyncio.ensure_future(self._attempt(invoke, tokens))
+            tasks.add(secondary)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is secondary:
+                            self.count("hedge_wins")
+                        return task.result()
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def run_sync(self, invoke: Callable[[], T], tokens: int = 0) -> T:
+        """Blocking form of `run` for sync callers on worker threads, without hedging."""
+        self.count("calls")
+        wait = self._reserve(tokens)
+        if wait:
+            time.sleep(wait)
+        with self._slots:
+            start = time.monotonic()
+            result = invoke()
+            self.latencies.append(time.monotonic() - start)
+            return result
+
+    def stats(self) -> dict:
+        return {
+            **self.counts,
+            "in_flight": self.in_flight,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "hedge_delay": self.hedge_delay(),
+            "under_pressure": self.under_pressure(),
+        }
+
+
+_MODEL_LIMITS = {
+    ANSWER_LLM_MODEL: (ANSWER_LLM_RPM, ANSWER_LLM_TPM),
+    QUERY_LLM_MODEL: (QUERY_LLM_RPM, QUERY_LLM_TPM),
+    EMBEDDING_MODEL: (EMBEDDING_RPM, EMBEDDING_TPM),
+}
+_gates: Dict[str, ModelGate] = {}
+_gates_lock = threading.Lock()
+
+
+def get_gate(model: str) -> ModelGate:
+    with _gates_lock:
+        if model not in _gates:
+            _gates[model] = ModelGate(model, *_MODEL_LIMITS.get(model, (0, 0)))
+        return _gates[model]
+
+
+def model_stats() -> dict:
+    with _gates_lock:
+        gates = list(_gates.values())
+    return {gate.model: gate.stats() for gate in gates}
+
+
+def _exception_chain(exc: BaseException) -> Iterator[BaseException]:
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        yield exc
+        exc = exc.__cause__ or exc.__context__
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    from langchain_core.exceptions import ModelRateLimitError
+
+    for e in _exception_chain(exc):
+        if isinstance(e, ModelRateLimitError):
+            return 429
+        for attr in ("code", "status_code"):
+            code = getattr(e, attr, None)
+            if isinstance(code, int) and 100 <= code < 600:
+                return code
+        response = getattr(e, "response", None)
+        if isinstance(getattr(response, "status_code", None), int):
+            return response.status_code
+    return None
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    return _status_code(exc) == 429
+
+
+def is_retryable(exc: BaseException) -> bool:
+    import httpx
+    from langchain_core.exceptions import ModelConnectionError, ModelTimeoutError
+
+    if any(isinstance(e, (httpx.TransportError, asyncio.TimeoutError, ConnectionError, ModelConnectionError, ModelTimeoutError))
+           for e in _exception_chain(exc)):
+        return True
+    return _status_code(exc) in RETRYABLE_STATUS_CODES
+
+
+def backoff_delay(attempt: int, exc: Optional[BaseException] = None) -> float:
+    """Full-jitter exponential backoff, raised to the server's retry hint when it sends one."""
+    delay = random.uniform(0, min(MODEL_BACKOFF_MAX_SECONDS, MODEL_BACKOFF_BASE_SECONDS * 2 ** attempt))
+    match = _RETRY_DELAY_RE.search(str(exc)) if exc is not None else None
+    if match:
+        delay = max(delay, float(match.group(1)) * random.uniform(1.0, 1.2))
+    return min(delay, MODEL_BACKOFF_MAX_SECONDS)
+
+
+async def call_model(
+    model: str,
+    invoke: Callable[[str], Awaitable[T]],
+    tokens: int = 0,
+    fallback: Optional[str] = None,
+    hedge: bool = MODEL_HEDGING_ENABLED,
+    max_retries: int = MODEL_MAX_RETRIES,
+) -> T:
+    """
+    Calls `invoke(model_name)` through the model's gate, retrying rate limits,
+    server errors and timeouts with jittered exponential backoff.
+
+    `tokens` is the estimated input size, charged to the model's token bucket.
+    With a `fallback` model (and MODEL_FALLBACK_ENABLED), calls go to the
+    fallback while `model` is under pressure, i.e. recently rate limited or
+    throttled beyond MODEL_FALLBACK_MAX_WAIT_SECONDS. A rate limit that
+    outlasts every retry raises ModelOverloadedError.
+    """
+    use_fallback = fallback is not None and fallback != model and MODEL_FALLBACK_ENABLED
+    for attempt in range(max_retries + 1):
+        target = model
+        if use_fallback and get_gate(model).under_pressure(tokens) and not get_gate(fallback).under_pressure(tokens):
+            target = fallback
+            get_gate(model).count("fallbacks")
+        gate = get_gate(target)
+        try:
+            return await gate.run(lambda: invoke(target), tokens, hedge)
+        except Exception as e:
+            delay = _retry_delay(gate, e, attempt, max_retries)
+        await asyncio.sleep(delay)
+
+
+def call_model_sync(model: str, invoke: Callable[[str], T], tokens: int = 0, max_retries: int = MODEL_MAX_RETRIES) -> T:
+    """
+    Blocking form of `call_model` for sync code paths, sharing the model's buckets,
+    retries and counters; no hedging or fallback. Call it off the event loop.
+    """
+    gate = get_gate(model)
+    for attempt in range(max_retries + 1):
+        try:
+            return gate.run_sync(lambda: invoke(model), tokens)
+        except Exception as e:
+            delay = _retry_delay(gate, e, attempt, max_retries)
+        time.sleep(delay)
+
+
+def _retry_delay(gate: ModelGate, exc: Exception, attempt: int, max_retries: int) -> float:
+    """Records a failed attempt and returns the backoff before the next one, or raises when it should not be retried."""
+    if is_rate_limited(exc):
+        gate.mark_rate_limited()
+    if not is_retryable(exc):
+        gate.count("failures")
+        raise exc
+    if attempt == max_retries:
+        gate.count("failures")
+        if is_rate_limited(exc):
+            raise ModelOverloadedError(gate.model, backoff_delay(attempt, exc) or MODEL_BACKOFF_BASE_SECONDS) from exc
+        raise exc
+    gate.count("retries")
+    return backoff_delay(attempt, exc)
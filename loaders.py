@@ -0,0 +1,130 @@
+import importlib
+import io
+import os
+import tempfile
+import zipfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+from langchain_core.documents import Document
+
+
+class DocumentLoader(ABC):
+    """Base class for the application's loaders: a lazy `iter_documents()` plus an eager `load()`."""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    @abstractmethod
+    def iter_documents(self) -> Iterator[Document]:
+        ...
+
+    def load(self) -> List[Document]:
+        return list(self.iter_documents())
+
+
+FileSource = Union[str, BinaryIO]
+
+
+@dataclass(frozen=True)
+class LoaderSpec:
+    """
+    A registered file type. `target` is a "module:Class" path imported on first
+    use, so that a worker only pays for the parsing libraries of the formats it
+    actually sees. `sniff(head, source)` gets the first bytes of the file and,
+    when available, the whole file as a path or seekable binary file, for
+    formats that cannot be told apart by their first bytes.
+    """
+    extension: str
+    target: str
+    mime_types: Tuple[str, ...] = ()
+    sniff: Optional[Callable[[bytes, Optional[FileSource]], bool]] = None
+
+
+_REGISTRY: Dict[str, LoaderSpec] = {}
+_loader_classes: Dict[str, type] = {}
+
+
+def register_loader(spec: LoaderSpec) -> None:
+    """Registers (or replaces) the loader for `spec.extension`; sniffers are tried in registration order."""
+    _REGISTRY[spec.extension] = spec
+    _loader_classes.pop(spec.extension, None)
+
+
+def supported_extensions() -> List[str]:
+    return list(_REGISTRY)
+
+
+def detect_file_extension(head: bytes, content_type: str = "", url: str = "", source: Optional[FileSource] = None) -> str:
+    """
+    Picks the file extension from the file's content, then the Content-Type header,
+    then the URL path. `source` is the whole file, for sniffers that need more than `head`.
+    """
+    for spec in _REGISTRY.values():
+        if spec.sniff and spec.sniff(head, source):
+            return spec.extension
+    mime_type = content_type.split(";")[0].strip().lower()
+    for spec in _REGISTRY.values():
+        if mime_type in spec.mime_types:
+            return spec.extension
+    return os.path.splitext(urlparse(url).path)[1].lower()
+
+
+def get_loader(file_path: str, file_extension: Optional[str] = None, **kwargs) -> DocumentLoader:
+    file_extension = (file_extension or os.path.splitext(file_path)[1]).lower()
+    spec = _REGISTRY.get(file_extension)
+    if spec is None:
+        raise ValueError(f"Unsupported file type for loading: {file_extension}")
+    loader_cls = _loader_classes.get(file_extension)
+    if loader_cls is None:
+        module_name, class_name = spec.target.split(":")
+        loader_cls = _loader_classes[file_extension] = getattr(importlib.import_module(module_name), class_name)
+    return loader_cls(file_path, **kwargs)
+
+
+def load_bytes(data: bytes, filename: str = "", content_type: str = "",
+               loader_kwargs: Optional[Dict[str, dict]] = None) -> Iterator[Document]:
+    """
+    Sniffs and loads an in-memory file, such as an e-mail attachment, through the
+    registry, passing `loader_kwargs[extension]` to the chosen loader. Yields
+    nothing for unsupported types.
+    """
+    file_extension = detect_file_extension(data[:512], content_type, filename, io.BytesIO(data))
+    if file_extension not in _REGISTRY:
+        return
+    fd, path = tempfile.mkstemp(suffix=file_extension)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        yield from get_loader(path, file_extension, **(loader_kwargs or {}).get(file_extension, {})).iter_documents()
+    finally:
+        os.remove(path)
+
+
+def _is_docx(head: bytes, source: Optional[FileSource]) -> bool:
+    """A zip archive holding word/document.xml; xlsx, pptx and other zips are not docx."""
+    if not head.startswith(b"PK\x03\x04") or source is None:
+        return False
+    try:
+        with zipfile.ZipFile(source) as archive:
+            archive.getinfo("word/document.xml")
+        return True
+    except (zipfile.BadZipFile, KeyError, OSError):
+        return False
+
+
+EMAIL_HEADER_PREFIXES = (b"From:", b"Received:", b"Return-Path:", b"MIME-Version:", b"Subject:", b"Delivered-To:", b"Message-ID:", b"Date:", b"To:")
+
+register_loader(LoaderSpec(".pdf", "pdf_loader:PDFLoader", ("application/pdf",), lambda head, source: head.startswith(b"%PDF")))
+register_loader(LoaderSpec(
+    ".docx", "docx_loader:DocxLoader",
+    ("application/vnd.openxmlformats-officedocument.wordprocessingml.document",),
+    _is_docx,
+))
+register_loader(LoaderSpec(
+    ".msg", "email_loader:EmailLoader", ("application/vnd.ms-outlook",),
+    lambda head, source: head.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"),
+))
+register_loader(LoaderSpec(".eml", "email_loader:EmailLoader", ("message/rfc822",), lambda head, source: head.lstrip().startswith(EMAIL_HEADER_PREFIXES)))
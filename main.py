@@ -1,67 +1,124 @@
+import asyncio
 import os
 import time
 import traceback
-from fastapi import FastAPI, HTTPException, Body, status, Depends, Request, BackgroundTasks
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Body, status, Depends, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from typing import List
+from typing import AsyncIterator, Literal, Optional
 from rich import print as rprint
 from rich.panel import Panel
-import requests
+import httpx
+from pydantic import HttpUrl, TypeAdapter, ValidationError
 
-from models import QueryRequest, QueryResponse, FinalAnswer
-from query_service import QueryService
-from config import GOOGLE_API_KEY, API_AUTH_TOKEN
+import metrics
+
+from models import QueryRequest, QueryResponse, FinalAnswer, StreamEvent, PrefetchRequest, PrefetchResponse
+from document_manager import DocumentManager, DocumentTooLargeError
+from llm import ModelOverloadedError
+from config import GOOGLE_API_KEY, API_AUTH_TOKEN, METRICS_ENABLED, SERVER_TIMING_ENABLED, STARTUP_MODE, STARTUP_WARMUP
+
+# The query service (and with it LangChain, LangGraph, Chroma and the Gemini SDK) is
+# imported and built on first use: in the lifespan hook when STARTUP_MODE is "eager",
+# on the first request that needs it when "lazy".
+query_service = None
+_query_service_lock = asyncio.Lock()
+
+def _build_query_service():
+    from query_service import QueryService
+
+    service = QueryService()
+    if METRICS_ENABLED:
+        metrics.REGISTRY.register(metrics.CacheStatsCollector(service.cache_stats))
+    return service
+
+async def get_query_service():
+    global query_service
+    if query_service is None:
+        async with _query_service_lock:
+            if query_service is None:
+                query_service = await asyncio.to_thread(_build_query_service)
+    return query_service
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not GOOGLE_API_KEY or not API_AUTH_TOKEN:
+        raise RuntimeError("Missing critical environment variables: GOOGLE_API_KEY and API_AUTH_TOKEN")
+    DocumentManager.get_http_client()
+    if STARTUP_MODE == "eager":
+        service = await get_query_service()
+        if STARTUP_WARMUP:
+            start = time.perf_counter()
+            await service.awarm_up()
+            rprint(f"[cyan]Warm-up[/cyan] [bold green]completed in {time.perf_counter() - start:.2f}s[/bold green]")
+    rprint(Panel(f"Application startup complete ({STARTUP_MODE} mode).", title="[green]System Status[/green]"))
+    yield
+    if query_service is not None:
+        await query_service.ingestion.aclose()
+    await DocumentManager.aclose_http_client()
 
 app = FastAPI(
     title="Batch-Optimized RAG System",
     description="Processes documents and answers a list of questions together with high efficiency.",
     version="11.0.0",
+    lifespan=lifespan,
 )
-query_service = QueryService()
 security = HTTPBearer()
+_http_url = TypeAdapter(HttpUrl)
 
 async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     if credentials.scheme != "Bearer" or credentials.credentials != API_AUTH_TOKEN:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or missing API token")
     return True
 
-@app.on_event("startup")
-def on_startup():
-    if not GOOGLE_API_KEY or not API_AUTH_TOKEN:
-        raise RuntimeError("Missing critical environment variables: GOOGLE_API_KEY and API_AUTH_TOKEN")
-    rprint(Panel("Application startup complete.", title="[green]System Status[/green]"))
-
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
     start_time = time.time()
+    timings = metrics.start_request_timings() if SERVER_TIMING_ENABLED else None
     response = await call_next(request)
     process_time = time.time() - start_time
     response.headers["X-Process-Time"] = f"{process_time:.4f} sec"
+    if timings:
+        response.headers["Server-Timing"] = f"{metrics.server_timing_header(timings)}, total;dur={process_time * 1000:.1f}"
     rprint(f"[cyan]Request[/cyan] '{request.method} {request.url.path}' [bold green]completed in {process_time:.4f}s[/bold green]")
     return response
 
 @app.post(
     "/hackrx/run",
     response_model=QueryResponse,
+    response_model_exclude_none=True,
     tags=["Query Processing"],
     summary="Process a Document and Answer a Batch of Questions"
 )
 async def run_submission(
     request_body: QueryRequest,
-    background_tasks: BackgroundTasks,
-    authenticated: bool = Depends(verify_token)
+    response: Response,
+    debug: bool = False,
+    authenticated: bool = Depends(verify_token),
+    query_service=Depends(get_query_service)
 ):
     rprint(Panel(f"Processing request for document: [blue]{request_body.documents}[/blue]", title="[cyan]New Request[/cyan]"))
     try:
-        results: List[str] = query_service.process_queries(
+        result: QueryResponse = await query_service.aprocess_queries(
             document_url=str(request_body.documents),
             questions=request_body.questions,
-            background_tasks=background_tasks
+            top_k=request_body.top_k,
+            decompose=request_body.decompose
         )
-        return QueryResponse(answers=results)
-    except requests.exceptions.RequestException as e:
+        response.headers["X-Answer-Cache"] = ",".join(result.cache_status or [])
+        if not debug:
+            result.cache_status = None
+        return result
+    except httpx.HTTPError as e:
         rprint(Panel(f"[bold red]Document Download Failed:[/bold red]\n{e}", title="[red]Error[/red]"))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Failed to download document: {e}")
+    except DocumentTooLargeError as e:
+        rprint(Panel(f"[bold red]Document Too Large:[/bold red]\n{e}", title="[red]Error[/red]"))
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except ModelOverloadedError as e:
+        rprint(Panel(f"[bold red]Model Overloaded:[/bold red]\n{e}", title="[red]Error[/red]"))
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": str(max(1, round(e.retry_after)))})
     except ValueError as e:
         rprint(Panel(f"[bold red]Processing Error:[/bold red]\n{e}", title="[red]Error[/red]"))
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
@@ -70,6 +127,113 @@ async def run_submission(
         rprint(Panel(f"[bold red]An unexpected server error occurred:[/bold red]\n{tb_str}", title="[red]Server Error[/red]"))
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An internal server error occurred.")
 
+@app.post(
+    "/hackrx/run/stream",
+    tags=["Query Processing"],
+    summary="Stream Answers for a Batch of Questions as NDJSON or Server-Sent Events"
+)
+async def run_submission_stream(
+    request_body: QueryRequest,
+    format: Literal["ndjson", "sse"] = "ndjson",
+    authenticated: bool = Depends(verify_token),
+    query_service=Depends(get_query_service)
+):
+    rprint(Panel(f"Streaming request for document: [blue]{request_body.documents}[/blue]", title="[cyan]New Request[/cyan]"))
+
+    def encode(event: StreamEvent) -> str:
+        payload = event.model_dump_json(exclude_none=True)
+        return f"event: {event.event}\ndata: {payload}\n\n" if format == "sse" else f"{payload}\n"
+
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            async for event in query_service.astream_queries(
+                document_url=str(request_body.documents),
+                questions=request_body.questions,
+                top_k=request_body.top_k,
+                decompose=request_body.decompose
+            ):
+                yield encode(event)
+        except httpx.HTTPError as e:
+            yield encode(StreamEvent(event="error", status="download_failed", detail=f"Failed to download document: {e}"))
+        except DocumentTooLargeError as e:
+            rprint(Panel(f"[bold red]Document Too Large:[/bold red]\n{e}", title="[red]Error[/red]"))
+            yield encode(StreamEvent(event="error", status="too_large", detail=str(e)))
+        except ModelOverloadedError as e:
+            yield encode(StreamEvent(event="error", status="overloaded", detail=str(e)))
+        except ValueError as e:
+            yield encode(StreamEvent(event="error", status="unprocessable", detail=str(e)))
+        except Exception:
+            rprint(Panel(f"[bold red]An unexpected server error occurred:[/bold red]\n{traceback.format_exc()}", title="[red]Server Error[/red]"))
+            yield encode(StreamEvent(event="error", status="server_error", detail="An internal server error occurred."))
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(event_stream(), media_type=media_type)
+
+@app.post(
+    "/documents/prefetch",
+    response_model=PrefetchResponse,
+    response_model_exclude_none=True,
+    status_code=status.HTTP_202_ACCEPTED,
+    tags=["Ingestion"],
+    summary="Queue Documents for Background Indexing"
+)
+async def prefetch_documents(
+    request_body: PrefetchRequest,
+    authenticated: bool = Depends(verify_token),
+    query_service=Depends(get_query_service)
+):
+    from ingestion import IngestionQueueFull
+
+    try:
+        return PrefetchResponse(documents=[query_service.ingestion.submit(str(url)) for url in request_body.documents])
+    except IngestionQueueFull as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+@app.get(
+    "/documents/status",
+    response_model=PrefetchResponse,
+    response_model_exclude_none=True,
+    tags=["Ingestion"],
+    summary="Background Indexing Status of One or All Prefetched Documents"
+)
+async def document_status(
+    document_url: Optional[str] = None,
+    authenticated: bool = Depends(verify_token),
+    query_service=Depends(get_query_service)
+):
+    if document_url is None:
+        return PrefetchResponse(documents=query_service.ingestion.statuses())
+    try:
+        document_url = str(_http_url.validate_python(document_url))
+    except ValidationError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    job = query_service.ingestion.status(document_url)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document has not been prefetched")
+    return PrefetchResponse(documents=[job])
+
+@app.get("/metrics", tags=["Monitoring"], summary="Prometheus Metrics")
+def metrics_endpoint():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Metrics are disabled")
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/health", tags=["Monitoring"], summary="API Health Check")
 def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@app.get("/cache/stats", tags=["Monitoring"], summary="Index and Embedding Cache Hit/Miss Statistics")
+def cache_stats(authenticated: bool = Depends(verify_token), query_service=Depends(get_query_service)):
+    return query_service.cache_stats()
+
+@app.delete("/cache/answers", tags=["Monitoring"], summary="Invalidate Cached Answers")
+def invalidate_answers(
+    document_hash: Optional[str] = None,
+    document_url: Optional[str] = None,
+    authenticated: bool = Depends(verify_token),
+    query_service=Depends(get_query_service)
+):
+    if not query_service.answer_cache:
+        return {"invalidated": 0}
+    return {"invalidated": query_service.answer_cache.invalidate(document_hash=document_hash, document_url=document_url)}
\ No newline at end of file
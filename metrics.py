@@ -0,0 +1,187 @@
+import functools
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from config import METRICS_ENABLED
+
+REGISTRY = CollectorRegistry()
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds",
+    "Wall time spent in each pipeline stage.",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+    registry=REGISTRY,
+)
+TOKENS = Histogram(
+    "rag_tokens",
+    "Tokens per model call; embedding counts are estimated from text length.",
+    ["model", "kind"],
+    buckets=(16, 64, 256, 1024, 4096, 16384, 65536, 262144, 1048576),
+    registry=REGISTRY,
+)
+MODEL_EVENTS = Counter(
+    "rag_model_events",
+    "Model-call layer events: retries, rate limits, hedged calls and wins, fallbacks, failures.",
+    ["model", "event"],
+    registry=REGISTRY,
+)
+DECOMPOSITION_QUESTIONS = Counter(
+    "rag_decomposition_questions",
+    "Questions by decomposition route: rewritten, or answered from the original question's hits.",
+    ["route"],
+    registry=REGISTRY,
+)
+LLM_CALLS_SAVED = Counter(
+    "rag_llm_calls_saved",
+    "Model calls skipped because every question retrieved confidently.",
+    ["stage"],
+    registry=REGISTRY,
+)
+
+_request_timings: ContextVar[Optional[List[Tuple[str, float, float]]]] = ContextVar("request_timings", default=None)
+
+
+class _Span:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def enabled() -> bool:
+    return METRICS_ENABLED or _request_timings.get() is not None
+
+
+def span(stage: str):
+    """Times a block as `stage`. A shared no-op when neither metrics nor Server-Timing is on."""
+    return _Span(stage) if enabled() else _NULL_SPAN
+
+
+def timed(stage: str):
+    """Decorator form of `span` for coroutine functions, e.g. graph nodes."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(stage):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(stage: str, seconds: float) -> None:
+    if METRICS_ENABLED:
+        STAGE_SECONDS.labels(stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds, time.perf_counter()))
+
+
+def record_model_event(model: str, event: str) -> None:
+    if METRICS_ENABLED:
+        MODEL_EVENTS.labels(model, event).inc()
+
+
+def record_decomposition(rewritten: int, skipped: int) -> None:
+    if METRICS_ENABLED:
+        DECOMPOSITION_QUESTIONS.labels("rewritten").inc(rewritten)
+        DECOMPOSITION_QUESTIONS.labels("skipped").inc(skipped)
+        if not rewritten:
+            LLM_CALLS_SAVED.labels("decompose").inc()
+
+
+def record_tokens(model: str, kind: str, count: int) -> None:
+    if METRICS_ENABLED and count:
+        TOKENS.labels(model, kind).observe(count)
+
+
+def start_request_timings() -> List[Tuple[str, float, float]]:
+    """
+    Starts collecting spans for the current request. The returned list fills in with
+    (stage, seconds, perf_counter at the end) as stages finish.
+    """
+    timings: List[Tuple[str, float, float]] = []
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings: List[Tuple[str, float, float]]) -> str:
+    """Formats collected spans as a Server-Timing header, summing repeated stages."""
+    totals: Dict[str, List[float]] = {}
+    for stage, seconds, _ in timings:
+        total = totals.setdefault(stage, [0.0, 0])
+        total[0] += seconds
+        total[1] += 1
+    return ", ".join(
+        f'{stage};dur={seconds * 1000:.1f}' + (f';desc="x{count}"' if count > 1 else "")
+        for stage, (seconds, count) in totals.items()
+    )
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Records the prompt and completion token counts reported by a chat model."""
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def on_llm_end(self, response: LLMResult, **kwargs) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                record_tokens(self.model, "input", usage.get("input_tokens", 0))
+                record_tokens(self.model, "output", usage.get("output_tokens", 0))
+
+
+def llm_config(model: str) -> Optional[dict]:
+    """Run config that records token usage for `model`, or None when metrics are off."""
+    return {"callbacks": [TokenUsageCallback(model)]} if METRICS_ENABLED else None
+
+
+class CacheStatsCollector:
+    """Exports cache counters from a `cache_stats()`-style callable at scrape time, off the request path."""
+
+    def __init__(self, stats: Callable[[], dict]):
+        self.stats = stats
+
+    def collect(self):
+        hits = CounterMetricFamily("rag_cache_hits", "Cache hits.", labels=["cache"])
+        misses = CounterMetricFamily("rag_cache_misses", "Cache misses.", labels=["cache"])
+        hit_rate = GaugeMetricFamily("rag_cache_hit_ratio", "Cache hit rate since startup.", labels=["cache"])
+        for cache, stats in self.stats().items():
+            if "hits" not in stats:
+                continue
+            hits.add_metric([cache], stats["hits"] + stats.get("similar_hits", 0))
+            misses.add_metric([cache], stats["misses"])
+            hit_rate.add_metric([cache], stats["hit_rate"])
+        yield hits
+        yield misses
+        yield hit_rate
+
+
+def render() -> Tuple[bytes, str]:
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,12 +1,52 @@
-from pydantic import BaseModel, HttpUrl
-from typing import List
+from pydantic import BaseModel, Field, HttpUrl
+from typing import List, Literal, Optional
 
 class QueryRequest(BaseModel):
     documents: HttpUrl
     questions: List[str]
+    top_k: Optional[int] = Field(default=None, ge=1, le=50)
+    decompose: Optional[bool] = None
 
 class FinalAnswer(BaseModel):
     answer: str
 
+class NumberedAnswer(BaseModel):
+    question_number: int
+    answer: str
+
+class AnswerBatch(BaseModel):
+    answers: List[NumberedAnswer]
+
 class QueryResponse(BaseModel):
-    answers: List[str]
\ No newline at end of file
+    answers: List[str]
+    cache_status: Optional[List[str]] = None
+
+class StreamEvent(BaseModel):
+    event: str
+    stage: Optional[str] = None
+    status: Optional[str] = None
+    index: Optional[int] = None
+    answer: Optional[str] = None
+    fallback: Optional[bool] = None
+    cache: Optional[str] = None
+    chunks: Optional[int] = None
+    tokens: Optional[int] = None
+    answers: Optional[List[str]] = None
+    cache_status: Optional[List[str]] = None
+    detail: Optional[str] = None
+
+class PrefetchRequest(BaseModel):
+    documents: List[HttpUrl] = Field(min_length=1)
+
+class DocumentStatus(BaseModel):
+    document_url: str
+    status: Literal["queued", "indexing", "ready", "failed"]
+    document_hash: Optional[str] = None
+    chunks: Optional[int] = None
+    error: Optional[str] = None
+    queued_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+class PrefetchResponse(BaseModel):
+    documents: List[DocumentStatus]
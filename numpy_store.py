@@ -0,0 +1,79 @@
+import uuid
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    An in-process vector store backed by one contiguous float32 matrix.
+
+    Search is an exact cosine top-k: a single matrix product followed by
+    `argpartition`, vectorized over any number of queries. The matrix may be a
+    read-only memory map of the index cache's `.npy` file, so reopening a cached
+    document does not copy its vectors.
+    """
+
+    def __init__(self, embedding: Embeddings, documents: Optional[List[Document]] = None, vectors=None):
+        self.embedding = embedding
+        self.documents: List[Document] = list(documents or [])
+        dim = vectors.shape[1] if vectors is not None and len(vectors) else 0
+        self.vectors = vectors if vectors is not None else np.empty((0, dim), dtype=np.float32)
+        self._inverse_norms = self._compute_inverse_norms(self.vectors)
+
+    @staticmethod
+    def _compute_inverse_norms(vectors) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1) if len(vectors) else np.empty(0, dtype=np.float32)
+        return np.divide(1.0, norms, out=np.zeros_like(norms, dtype=np.float32), where=norms > 0).astype(np.float32)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, *, ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        new_vectors = np.asarray(self.embedding.embed_documents(texts), dtype=np.float32)
+        self.documents.extend(Document(id=i, page_content=t, metadata=m) for i, t, m in zip(ids, texts, metadatas))
+        self.vectors = np.ascontiguousarray(np.vstack([self.vectors, new_vectors]) if len(self.vectors) else new_vectors)
+        self._inverse_norms = self._compute_inverse_norms(self.vectors)
+        return ids
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, *, ids: Optional[List[str]] = None, **kwargs: Any) -> "NumpyVectorStore":
+        store = cls(embedding)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    def similarity_search_by_vectors_with_scores(self, query_vectors, k: int = 4) -> List[List[Tuple[Document, float]]]:
+        """Returns the top-k (document, cosine similarity) hits for every query vector."""
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        if not len(self.documents) or not len(queries):
+            return [[] for _ in queries]
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = (queries @ self.vectors.T) * self._inverse_norms
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+        return [
+            [(self.documents[i], float(s)) for i, s in zip(row_ids, row_scores)]
+            for row_ids, row_scores in zip(top, top_scores)
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vectors_with_scores([self.embedding.embed_query(query)], k)[0]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vectors_with_scores([embedding], k)[0]]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return lambda score: score
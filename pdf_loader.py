@@ -1,40 +1,95 @@
+import multiprocessing
 import os
-import re
+import threading
 import fitz
+from concurrent.futures import ProcessPoolExecutor
 from langchain_core.documents import Document
-from langchain_community.document_loaders import UnstructuredEmailLoader, Docx2txtLoader
-from typing import List
+from typing import Iterator, List, Optional, Tuple
+from chunker import LayoutLine, is_table_line
+from loaders import DocumentLoader
+from config import PDF_PARSE_WORKERS, PDF_PARALLEL_MIN_PAGES, PDF_PAGES_PER_TASK
 
-class PDFLoader:
-    def __init__(self, file_path: str):
-        self.file_path = file_path
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
 
-    def _is_table_line(self, line_text: str) -> bool:
-        return bool(re.search(r"(\s{2,}|\t)", line_text)) and len(line_text.strip()) > 10
 
-    def load(self) -> list[Document]:
-        documents = []
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _worker_ready() -> int:
+    return os.getpid()
+
+
+def warm_up_pool() -> None:
+    """Starts the spawn workers ahead of the first large PDF, so it does not pay for their interpreter start-up and imports."""
+    if PDF_PARSE_WORKERS > 1:
+        list(_get_pool().map(_worker_ready, range(PDF_PARSE_WORKERS)))
+
+
+def _page_lines(page) -> List[LayoutLine]:
+    lines = []
+    for block in page.get_text("dict").get("blocks", []):
+        if block["type"] == 0:
+            for line in block.get("lines", []):
+                spans = line.get("spans", [])
+                line_text = " ".join([span["text"] for span in spans]).strip()
+                if line_text:
+                    lines.append(LayoutLine(line_text, max(span["size"] for span in spans), is_table_line(line_text)))
+    return lines
+
+
+def _page_content(lines: List[LayoutLine]) -> str:
+    full_text = "\n".join(line.text for line in lines if not line.is_table).strip()
+    table_text = "\n".join(line.text for line in lines if line.is_table).strip()
+    combined_text = ""
+    if full_text: combined_text += f"### Text Content ###\n{full_text}\n"
+    if table_text: combined_text += f"\n### Table Content ###\n{table_text}\n"
+    return combined_text.strip()
+
+
+def _extract_page_range(file_path: str, start: int, stop: int) -> List[Tuple[int, List[LayoutLine]]]:
+    """Process-pool worker: opens the PDF itself and extracts the lines of pages [start, stop)."""
+    with fitz.open(file_path) as doc:
+        return [(page_number, _page_lines(doc[page_number])) for page_number in range(start, stop)]
+
+
+class PDFLoader(DocumentLoader):
+    def __init__(self, file_path: str, parallel: Optional[bool] = None):
+        super().__init__(file_path)
+        self.parallel = parallel
+
+    def iter_pages(self) -> Iterator[Tuple[int, List[LayoutLine]]]:
+        """Yields (1-based page number, layout lines) per non-empty page, in page order, as soon as each page is extracted."""
         with fitz.open(self.file_path) as doc:
-            for page_number, page in enumerate(doc):
-                page_dict, text_lines, table_lines = page.get_text("dict"), [], []
-                for block in page_dict.get("blocks", []):
-                    if block["type"] == 0:
-                        for line in block.get("lines", []):
-                            line_text = " ".join([span["text"] for span in line.get("spans", [])]).strip()
-                            if self._is_table_line(line_text): table_lines.append(line_text)
-                            else: text_lines.append(line_text)
-                
-                full_text, table_text = "\n".join(text_lines).strip(), "\n".join(table_lines).strip()
-                combined_text = ""
-                if full_text: combined_text += f"### Text Content ###\n{full_text}\n"
-                if table_text: combined_text += f"\n### Table Content ###\n{table_text}\n"
-                
-                if combined_text:
-                    documents.append(Document(page_content=combined_text.strip(), metadata={"page": page_number + 1}))
-        return documents
-
-def loader_factory(file_path: str, file_extension: str):
-    if file_extension == ".pdf": return PDFLoader(file_path)
-    elif file_extension == ".docx": return Docx2txtLoader(file_path)
-    elif file_extension in [".eml", ".msg"]: return UnstructuredEmailLoader(file_path, mode="single", process_attachments=False)
-    else: raise ValueError(f"Unsupported file type for loading: {file_extension}")
\ No newline at end of file
+            page_count = doc.page_count
+            use_pool = self.parallel if self.parallel is not None else (PDF_PARSE_WORKERS > 1 and page_count >= PDF_PARALLEL_MIN_PAGES)
+            if not use_pool:
+                for page_number, page in enumerate(doc):
+                    lines = _page_lines(page)
+                    if lines:
+                        yield page_number + 1, lines
+                return
+
+        pool = _get_pool()
+        futures = [
+            pool.submit(_extract_page_range, self.file_path, start, min(start + PDF_PAGES_PER_TASK, page_count))
+            for start in range(0, page_count, PDF_PAGES_PER_TASK)
+        ]
+        try:
+            for future in futures:
+                for page_number, lines in future.result():
+                    if lines:
+                        yield page_number + 1, lines
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def iter_documents(self) -> Iterator[Document]:
+        """Yields one Document per non-empty page, with table rows gathered after the text."""
+        for page, lines in self.iter_pages():
+            yield Document(page_content=_page_content(lines), metadata={"page": page})
@@ -1,24 +1,183 @@
-from typing import List
-from fastapi import BackgroundTasks
-from models import FinalAnswer
+import asyncio
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+from answer_cache import AnswerCache, CACHE_MISS
+from models import QueryResponse, StreamEvent
 from document_manager import DocumentManager
-from retriever import VectorStoreProvider
-from workflow import RAGWorkflow
+from coalescing import DocumentPool, SingleFlight
+from ingestion import IngestionQueue
+from embeddings import get_embedding_model
+from index_cache import IndexCache
+from llm import model_stats
+from retriever import VectorStoreProvider, warm_up_vector_store
+from workflow import RAGWorkflow, NOT_ENOUGH_INFORMATION
+from config import ANSWER_CACHE_ENABLED
 
 class QueryService:
-    def __init__(self):
-        self.rag_workflow = RAGWorkflow()
+    def __init__(self, rag_workflow: Optional[RAGWorkflow] = None, embedding_model: Optional[Embeddings] = None):
+        self.rag_workflow = rag_workflow or RAGWorkflow()
+        self.embedding_model = embedding_model
+        self.index_cache = IndexCache()
+        self.answer_cache = AnswerCache(embedding_model or get_embedding_model()) if ANSWER_CACHE_ENABLED else None
+        self.documents = DocumentPool()
+        self.index_builds = SingleFlight()
+        self.index_ingests = SingleFlight()
+        self.ingestion = IngestionQueue(self._ingest)
+
+    async def aprocess_queries(
+        self,
+        document_url: str,
+        questions: List[str],
+        top_k: Optional[int] = None,
+        decompose: Optional[bool] = None
+    ) -> QueryResponse:
+        return await self._run(document_url, questions, top_k, decompose, emit=lambda event: None)
+
+    async def astream_queries(
+        self,
+        document_url: str,
+        questions: List[str],
+        top_k: Optional[int] = None,
+        decompose: Optional[bool] = None
+    ) -> AsyncIterator[StreamEvent]:
+        """Yields progress and per-question answer events as they happen, then a final "done" event."""
+        events: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self._run(document_url, questions, top_k, decompose, emit=events.put_nowait))
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+            result = task.result()
+            yield StreamEvent(event="done", answers=result.answers, cache_status=result.cache_status)
+        finally:
+            if not task.done():
+                task.cancel()
+
+    async def _run(
+        self,
+        document_url: str,
+        questions: List[str],
+        top_k: Optional[int],
+        decompose: Optional[bool],
+        emit: Callable[[StreamEvent], None]
+    ) -> QueryResponse:
+        emit(StreamEvent(event="progress", stage="download", status="started"))
+        manager = await self.documents.acquire(document_url)
+        try:
+            emit(StreamEvent(event="progress", stage="download", status="done"))
+            return await self._answer(manager, document_url, questions, top_k, decompose, emit)
+        finally:
+            self.documents.release(document_url)
+
+    async def _answer(
+        self,
+        manager: DocumentManager,
+        document_url: str,
+        questions: List[str],
+        top_k: Optional[int],
+        decompose: Optional[bool],
+        emit: Callable[[StreamEvent], None]
+    ) -> QueryResponse:
+        document_hash = manager.get_content_hash()
+
+        if self.answer_cache:
+            cached = await self.answer_cache.alookup(document_hash, questions)
+        else:
+            cached = [(None, CACHE_MISS)] * len(questions)
+        answers = [answer for answer, _ in cached]
+        for i, (answer, status) in enumerate(cached):
+            if answer is not None:
+                emit(StreamEvent(event="answer", index=i, answer=answer, cache=status))
+        missing = [i for i, answer in enumerate(answers) if answer is None]
+
+        if missing:
+            # A background ingestion of this very content leaves the index in the cache, so wait for it rather than embed twice.
+            if await self.index_ingests.wait((document_url, document_hash)):
+                emit(StreamEvent(event="progress", stage="index", status="shared"))
+            provider, shared = await self.index_builds.do(
+                (document_url, document_hash),
+                lambda: VectorStoreProvider.create(manager, self.index_cache, self.embedding_model, on_progress=emit),
+            )
+            if shared:
+                emit(StreamEvent(event="progress", stage="index", status="shared"))
+            missing_questions = [questions[i] for i in missing]
+            generated: List[str] = []
+            fallbacks = set()
+            with provider.lease() as retriever:
+                async for event in self.rag_workflow.astream_batch(missing_questions, retriever, top_k, decompose):
+                    if event.event == "answer":
+                        if event.fallback:
+                            fallbacks.add(event.index)
+                        emit(event.model_copy(update={"index": missing[event.index], "cache": CACHE_MISS}))
+                    elif event.event == "complete":
+                        generated = event.answers
+                    else:
+                        emit(event)
+            for i, answer in zip(missing, generated):
+                answers[i] = answer
+            # Placeholders for questions the model failed to answer are not cached, so the next request tries again.
+            stored = [i for i in range(len(generated)) if i not in fallbacks]
+            if self.answer_cache and len(generated) == len(missing) and stored:
+                await self.answer_cache.astore(
+                    document_hash, document_url, [missing_questions[i] for i in stored], [generated[i] for i in stored]
+                )
+
+        return QueryResponse(
+            answers=[answer if answer is not None else NOT_ENOUGH_INFORMATION for answer in answers],
+            cache_status=[status for _, status in cached],
+        )
+
+    async def _ingest(self, document_url: str) -> Tuple[str, int]:
+        """Downloads the document and stores its index in the index cache; the ingestion queue's job."""
+        manager = await self.documents.acquire(document_url)
+        try:
+            document_hash = manager.get_content_hash()
+            key = (document_url, document_hash)
+            await self.index_builds.wait(key)
+            chunks, _ = await self.index_ingests.do(
+                key, lambda: VectorStoreProvider.ingest(manager, self.index_cache, self.embedding_model)
+            )
+            return document_hash, chunks
+        finally:
+            self.documents.release(document_url)
+
+    async def awarm_up(self) -> None:
+        """
+        Exercises the embedding client, the LLM clients, the vector store and the PDF parsing
+        pool once, so the first real request does not pay for connection set-up or worker start-up.
+        """
+        from pdf_loader import warm_up_pool
+
+        embedding_model = self.embedding_model or get_embedding_model()
+        await asyncio.gather(
+            embedding_model.aembed_query("warm-up"),
+            self.rag_workflow.awarm_up(),
+            asyncio.to_thread(warm_up_pool),
+            asyncio.to_thread(warm_up_vector_store),
+        )
+
+    def cache_stats(self) -> dict:
+        embedding_model = self.embedding_model or get_embedding_model()
+        stats = {"index": self.index_cache.stats()}
+        if hasattr(embedding_model, "stats"):
+            stats["embeddings"] = embedding_model.stats()
+        if self.answer_cache:
+            stats["answers"] = self.answer_cache.stats()
+        stats["coalescing"] = {
+            "downloads": self.documents.stats(),
+            "index_builds": self.index_builds.stats(),
+            "index_ingests": self.index_ingests.stats(),
+        }
+        stats["ingestion"] = self.ingestion.stats()
+        stats["models"] = model_stats()
+        stats["decomposition"] = self.rag_workflow.decomposition_stats()
+        return stats
 
     def process_queries(
         self,
         document_url: str,
         questions: List[str],
-        background_tasks: BackgroundTasks
-    ) -> List[str]:
-        
-        manager = DocumentManager(document_url)
-        retriever = VectorStoreProvider(manager).get_retriever()
-        
-        results = self.rag_workflow.invoke_batch(questions, retriever)
-        background_tasks.add_task(manager.cleanup)
-        return results
+        top_k: Optional[int] = None,
+        decompose: Optional[bool] = None
+    ) -> QueryResponse:
+        return asyncio.run(self.aprocess_queries(document_url, questions, top_k, decompose))
\ No newline at end of file
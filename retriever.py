@@ -1,26 +1,359 @@
-from langchain_chroma import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+import asyncio
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
 from langchain_core.vectorstores import VectorStoreRetriever
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+import metrics
+from batch_planner import estimate_tokens
+from bm25 import BM25Index, reciprocal_rank_fusion
+from chunker import LayoutChunker, lines_from_text
 from document_manager import DocumentManager
-from pdf_loader import loader_factory
-from config import EMBEDDING_MODEL
+from embeddings import EmbeddingBackend, get_embedding_model
+from models import StreamEvent
+from index_cache import IndexCache
+from numpy_store import NumpyVectorStore
+from loaders import get_loader
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+from config import CHUNKING_STRATEGY, CHUNK_SIZE, CHUNK_OVERLAP, RETRIEVAL_MAX_WORKERS, VECTOR_STORE_BACKEND, CHROMA_MAX_COLLECTIONS, RETRIEVAL_MODE, RETRIEVAL_TOP_K, HYBRID_CANDIDATE_MULTIPLIER, RRF_K
+
+_search_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_MAX_WORKERS, thread_name_prefix="retrieval")
+_chroma_client = None
+_chroma_client_lock = threading.Lock()
+_chroma_collections: "OrderedDict[str, int]" = OrderedDict()  # name -> leases held
+_chroma_collections_lock = threading.Lock()
+
+
+def get_chroma_client():
+    """Creates the process-wide in-memory Chroma client once; concurrent first use races inside chromadb."""
+    global _chroma_client
+    with _chroma_client_lock:
+        if _chroma_client is None:
+            import chromadb
+            _chroma_client = chromadb.EphemeralClient()
+        return _chroma_client
+
+
+def _acquire_chroma_collection(name: str) -> None:
+    """
+    Leases a collection on the shared client and marks it as most recently used.
+    Least recently used collections beyond CHROMA_MAX_COLLECTIONS are deleted, so
+    the in-memory client does not grow with every document ever indexed, but only
+    once no lease holds them: a retriever that is answering questions keeps its
+    collection. An evicted document is rebuilt from the index cache on its next
+    request.
+    """
+    with _chroma_collections_lock:
+        _chroma_collections[name] = _chroma_collections.pop(name, 0) + 1
+        _evict_chroma_collections()
+
+
+def _release_chroma_collection(name: str) -> None:
+    # Eviction waits for the next lease, so a collection just built is still there when its requests lease it.
+    with _chroma_collections_lock:
+        if name in _chroma_collections:
+            _chroma_collections[name] -= 1
+
+
+def _evict_chroma_collections() -> None:
+    # Runs under _chroma_collections_lock, so a collection cannot be leased again between being picked and deleted.
+    from chromadb.errors import NotFoundError
+
+    excess = len(_chroma_collections) - CHROMA_MAX_COLLECTIONS
+    if excess <= 0:
+        return
+    for name in [name for name, leases in _chroma_collections.items() if leases == 0][:excess]:
+        del _chroma_collections[name]
+        try:
+            get_chroma_client().delete_collection(name)
+        except NotFoundError:
+            pass
+
+
+def warm_up_vector_store(vector_store_backend: str = VECTOR_STORE_BACKEND) -> None:
+    """Imports the Chroma integration and creates its client ahead of the first index build."""
+    if vector_store_backend == "chroma":
+        import langchain_chroma  # noqa: F401
+        get_chroma_client()
+
+class HybridRetriever(VectorStoreRetriever):
+    """A vector retriever whose results are fused with BM25 keyword hits by reciprocal rank fusion."""
+    bm25: BM25Index
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun, **kwargs) -> List[Document]:
+        k = kwargs.get("k", self.search_kwargs.get("k", RETRIEVAL_TOP_K))
+        candidates = k * HYBRID_CANDIDATE_MULTIPLIER
+        vector_docs = self.vectorstore.similarity_search(query, k=candidates)
+        keyword_docs = [doc for doc, _ in self.bm25.search(query, candidates)]
+        return [doc for doc, _ in reciprocal_rank_fusion([vector_docs, keyword_docs], k, RRF_K)]
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun, **kwargs) -> List[Document]:
+        hits = await abatch_search(self, [query], kwargs.get("k"))
+        return [doc for doc, _ in hits[0]]
+
 
 class VectorStoreProvider:
-    def __init__(self, manager: DocumentManager):
+    def __init__(self, manager: DocumentManager, index_cache: Optional[IndexCache] = None, embedding_model: Optional[Embeddings] = None,
+                 vector_store_backend: str = VECTOR_STORE_BACKEND, retrieval_mode: str = RETRIEVAL_MODE,
+                 on_progress: Optional[Callable[[StreamEvent], None]] = None, chunking_strategy: str = CHUNKING_STRATEGY):
+        if vector_store_backend not in ("chroma", "numpy"):
+            raise ValueError(f"Unsupported vector store backend: {vector_store_backend}")
+        if retrieval_mode not in ("vector", "hybrid"):
+            raise ValueError(f"Unsupported retrieval mode: {retrieval_mode}")
+        if chunking_strategy not in ("layout", "recursive"):
+            raise ValueError(f"Unsupported chunking strategy: {chunking_strategy}")
         self.manager = manager
-        self.retriever = self._create_retriever()
+        self.index_cache = index_cache
+        self.embedding_model = embedding_model or get_embedding_model()
+        self.vector_store_backend = vector_store_backend
+        self.retrieval_mode = retrieval_mode
+        self.on_progress = on_progress
+        self.chunking_strategy = chunking_strategy
+        self.retriever = None
+        self.collection_name: Optional[str] = None
+
+    @classmethod
+    async def create(cls, manager: DocumentManager, index_cache: Optional[IndexCache] = None, embedding_model: Optional[Embeddings] = None,
+                     vector_store_backend: str = VECTOR_STORE_BACKEND, retrieval_mode: str = RETRIEVAL_MODE,
+                     on_progress: Optional[Callable[[StreamEvent], None]] = None, chunking_strategy: str = CHUNKING_STRATEGY) -> "VectorStoreProvider":
+        provider = cls(manager, index_cache, embedding_model, vector_store_backend, retrieval_mode, on_progress, chunking_strategy)
+        provider.retriever = await provider._create_retriever()
+        return provider
+
+    @classmethod
+    async def ingest(cls, manager: DocumentManager, index_cache: IndexCache, embedding_model: Optional[Embeddings] = None,
+                     chunking_strategy: str = CHUNKING_STRATEGY) -> int:
+        """
+        Parses, embeds and stores the document in the persistent index cache without
+        building an in-memory store, so a later `create` for it is a cache hit.
+        Returns the number of chunks.
+        """
+        provider = cls(manager, index_cache, embedding_model, chunking_strategy=chunking_strategy)
+        _, split_docs, _ = await provider._load_or_build_index(mmap=True)
+        return len(split_docs)
+
+    def _iter_chunks(self, parse_seconds: List[float]) -> Iterator[Document]:
+        loader = get_loader(self.manager.get_filepath(), self.manager.get_file_extension())
+        raw_documents = loader.iter_documents()
+        if self.chunking_strategy == "recursive":
+            text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+            for document in _timed_iter(raw_documents, parse_seconds):
+                yield from text_splitter.split_documents([document])
+            return
+
+        if hasattr(loader, "iter_pages"):
+            pages = loader.iter_pages()
+        else:
+            pages = ((document.metadata.get("page", i + 1), lines_from_text(document.page_content)) for i, document in enumerate(raw_documents))
+        yield from LayoutChunker().split(_timed_iter(pages, parse_seconds))
+
+    def _split_documents(self) -> List[Document]:
+        # Pages are parsed lazily while chunking, so time spent waiting on the loader is parsing and the rest is splitting.
+        parse_seconds = [0.0]
+        start = time.perf_counter()
+        split_docs = list(self._iter_chunks(parse_seconds))
+        if metrics.enabled():
+            metrics.record("parse", parse_seconds[0])
+            metrics.record("split", time.perf_counter() - start - parse_seconds[0])
+        if not split_docs: raise ValueError("Could not load any content from the document.")
+        return split_docs
+
+    async def _load_or_build_index(self, mmap: bool) -> Tuple[str, List[Document], np.ndarray]:
+        model_name = getattr(self.embedding_model, "model_name", type(self.embedding_model).__name__)
+        chunking = f"{self.chunking_strategy}-{CHUNK_SIZE}-{CHUNK_OVERLAP}"
+        cache_key = IndexCache.make_key(self.manager.document_url, self.manager.get_content_hash(), f"{model_name}|{chunking}")
+        cached = await asyncio.to_thread(self.index_cache.get, cache_key, mmap) if self.index_cache else None
+
+        if cached:
+            split_docs, embeddings = cached
+            self._progress("index", "cached", chunks=len(split_docs))
+        else:
+            split_docs = await asyncio.to_thread(self._split_documents)
+            for i, doc in enumerate(split_docs):
+                doc.metadata["chunk_id"] = f"{cache_key[:16]}-{i}"
+            texts = [doc.page_content for doc in split_docs]
+            embedding_tokens = sum(estimate_tokens(text) for text in texts)
+            self._progress("parse", "done", chunks=len(split_docs), tokens=embedding_tokens)
+            with metrics.span("embed"):
+                embeddings = await self.embedding_model.aembed_documents(texts)
+            metrics.record_tokens(model_name, "embedding", embedding_tokens)
+            self._progress("embed", "done", chunks=len(split_docs), tokens=embedding_tokens)
+            if self.index_cache:
+                await asyncio.to_thread(self.index_cache.put, cache_key, split_docs, embeddings, document_url=self.manager.document_url,
+                                        chunking=chunking, embedding_tokens=embedding_tokens)
+        return cache_key, split_docs, embeddings
 
-    def _create_retriever(self) -> VectorStoreRetriever:
-        loader = loader_factory(self.manager.get_filepath(), self.manager.get_file_extension())
-        raw_documents = loader.load()
-        if not raw_documents: raise ValueError("Could not load any content from the document.")
+    async def _create_retriever(self) -> VectorStoreRetriever:
+        cache_key, split_docs, embeddings = await self._load_or_build_index(mmap=self.vector_store_backend == "numpy")
+        with metrics.span("index_build"):
+            db = await asyncio.to_thread(self._build_store, cache_key, split_docs, embeddings)
+            if self.retrieval_mode == "hybrid":
+                bm25 = await asyncio.to_thread(BM25Index, split_docs)
+                retriever = HybridRetriever(vectorstore=db, search_kwargs={"k": RETRIEVAL_TOP_K}, bm25=bm25)
+            else:
+                retriever = db.as_retriever(search_kwargs={"k": RETRIEVAL_TOP_K})
+        self._progress("index", "done", chunks=len(split_docs))
+        return retriever
 
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150)
-        split_docs = text_splitter.split_documents(raw_documents)
-        embedding_model = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL)
-        db = Chroma.from_documents(split_docs, embedding=embedding_model)
-        return db.as_retriever(search_kwargs={"k": 5})
+    def _progress(self, stage: str, status: str, **details):
+        if self.on_progress:
+            self.on_progress(StreamEvent(event="progress", stage=stage, status=status, **details))
+
+    def _build_store(self, cache_key: str, split_docs: List[Document], embeddings):
+        if self.vector_store_backend == "numpy":
+            for doc in split_docs:
+                doc.id = doc.metadata["chunk_id"]
+            return NumpyVectorStore(self.embedding_model, split_docs, np.asarray(embeddings, dtype=np.float32))
+
+        from langchain_chroma import Chroma
+
+        collection_name = f"doc-{cache_key[:32]}"
+        _acquire_chroma_collection(collection_name)
+        try:
+            db = Chroma(
+                client=get_chroma_client(),
+                collection_name=collection_name,
+                embedding_function=self.embedding_model,
+                collection_configuration={"hnsw": {"space": "cosine"}},
+            )
+            self.collection_name = collection_name
+            if db._collection.count() == len(split_docs):
+                return db
+            vectors = np.asarray(embeddings, dtype=np.float32)
+            batch_size = get_chroma_client().get_max_batch_size()
+            for start in range(0, len(split_docs), batch_size):
+                batch = split_docs[start:start + batch_size]
+                db._collection.upsert(
+                    ids=[doc.metadata["chunk_id"] for doc in batch],
+                    embeddings=vectors[start:start + batch_size],
+                    documents=[doc.page_content for doc in batch],
+                    metadatas=[doc.metadata for doc in batch],
+                )
+            return db
+        finally:
+            _release_chroma_collection(collection_name)
 
     def get_retriever(self) -> VectorStoreRetriever:
         return self.retriever
+
+    @contextmanager
+    def lease(self) -> Iterator[VectorStoreRetriever]:
+        """Yields the retriever, keeping its Chroma collection from being evicted until the block exits."""
+        if self.collection_name:
+            _acquire_chroma_collection(self.collection_name)
+        try:
+            yield self.retriever
+        finally:
+            if self.collection_name:
+                _release_chroma_collection(self.collection_name)
+
+
+def _timed_iter(iterable: Iterable, elapsed: List[float]) -> Iterator:
+    """Yields from `iterable`, adding the time spent producing items to elapsed[0]."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            elapsed[0] += time.perf_counter() - start
+        yield item
+
+
+async def _aembed_queries(embeddings: Embeddings, queries: List[str]) -> List[List[float]]:
+    if isinstance(embeddings, EmbeddingBackend):
+        return await embeddings.aembed_queries(queries)
+    return await embeddings.aembed_documents(queries)
+
+
+def _is_chroma(db) -> bool:
+    """Checks for a Chroma store without importing chromadb, which is only loaded once a Chroma store is built."""
+    module = sys.modules.get("langchain_chroma")
+    return module is not None and isinstance(db, module.Chroma)
+
+
+def _chroma_multi_query(db: "Chroma", query_vectors: List[List[float]], k: int) -> List[List[Tuple[Document, float]]]:
+    n_results = min(k, db._collection.count())
+    if n_results == 0:
+        return [[] for _ in query_vectors]
+    result = db._collection.query(
+        query_embeddings=np.asarray(query_vectors, dtype=np.float32),
+        n_results=n_results,
+        include=["documents", "metadatas", "distances"],
+    )
+    return [
+        [
+            (Document(id=chunk_id, page_content=text, metadata=metadata or {}), 1.0 - distance)
+            for chunk_id, text, metadata, distance in zip(ids, texts, metadatas, distances)
+        ]
+        for ids, texts, metadatas, distances in zip(result["ids"], result["documents"], result["metadatas"], result["distances"])
+    ]
+
+
+async def _avector_search(db, queries: List[str], k: int) -> List[List[Tuple[Document, float]]]:
+    if isinstance(db, NumpyVectorStore):
+        query_vectors = await _aembed_queries(db.embeddings, queries)
+        return await asyncio.to_thread(db.similarity_search_by_vectors_with_scores, query_vectors, k)
+
+    if _is_chroma(db):
+        query_vectors = await _aembed_queries(db.embeddings, queries)
+        return await asyncio.to_thread(_chroma_multi_query, db, query_vectors, k)
+
+    loop = asyncio.get_running_loop()
+    return list(await asyncio.gather(*(
+        loop.run_in_executor(_search_executor, lambda q=q: db.similarity_search_with_relevance_scores(q, k=k))
+        for q in queries
+    )))
+
+
+async def abatch_search(retriever: VectorStoreRetriever, queries: List[str], k: Optional[int] = None) -> List[List[Tuple[Document, float]]]:
+    """
+    Runs every query against the retriever's vector store as one batch.
+
+    All queries are embedded with a single embedding call and, for Chroma and the
+    NumPy store, looked up with a single multi-query search. Other stores fall back
+    to per-query searches on a bounded thread pool. For a HybridRetriever the vector
+    hits are fused with BM25 hits and the scores are RRF scores. Returns
+    (document, score) hits per query, in order.
+    """
+    hits, _ = await abatch_search_with_similarity(retriever, queries, k)
+    return hits
+
+
+@metrics.timed("retrieve")
+async def abatch_search_with_similarity(
+    retriever: VectorStoreRetriever, queries: List[str], k: Optional[int] = None
+) -> Tuple[List[List[Tuple[Document, float]]], List[List[Tuple[Document, float]]]]:
+    """
+    `abatch_search`, plus each query's top-k vector similarity hits. The two are the
+    same list except in hybrid mode, where RRF scores only encode ranks and say
+    nothing about how well the best chunk matches.
+    """
+    if not queries:
+        return [], []
+    k = k or retriever.search_kwargs.get("k", RETRIEVAL_TOP_K)
+    if not isinstance(retriever, HybridRetriever):
+        hits = await _avector_search(retriever.vectorstore, queries, k)
+        return hits, hits
+
+    candidates = k * HYBRID_CANDIDATE_MULTIPLIER
+    vector_hits, keyword_hits = await asyncio.gather(
+        _avector_search(retriever.vectorstore, queries, candidates),
+        asyncio.to_thread(retriever.bm25.search_many, queries, candidates),
+    )
+    fused = [
+        reciprocal_rank_fusion([[doc for doc, _ in vector], [doc for doc, _ in keyword]], k, RRF_K)
+        for vector, keyword in zip(vector_hits, keyword_hits)
+    ]
+    return fused, [vector[:k] for vector in vector_hits]
\ No newline at end of file
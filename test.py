@@ -1,71 +1,76 @@
+"""
+Smoke test of the full pipeline.
+
+By default it runs offline: a synthetic policy PDF is served locally and the
+Gemini stub server stands in for the models. Pass --live to query the original
+arXiv paper with the real Gemini API configured in .env.
+"""
+import argparse
+import os
+import sys
+import tempfile
 from rich import print as rprint
 from rich.panel import Panel
-from fastapi import BackgroundTasks
-import sys
-import os
+
 sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+sys.path.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), "benchmarks"))
 
-from query_service import QueryService
+LIVE_DOCUMENT_URL = "https://arxiv.org/pdf/1706.03762.pdf"
+LIVE_QUESTIONS = [
+    "What is a Transformer and what are its components?",
+    "What was the BLEU score for the big Transformer model on the English-to-German translation task shown in Table 2?",
+    "How is the transformer model better from its predecessors?"
+]
 
-class MockBackgroundTasks(BackgroundTasks):
-    def __init__(self):
-        self.tasks_to_run = []
-        super().__init__()
 
-    def add_task(self, func, *args, **kwargs) -> None:
-        self.tasks_to_run.append(lambda: func(*args, **kwargs))
+def offline_setup():
+    from common import QUESTIONS, make_policy_pdf, serve_directory
+    from stub_server import start_stub_server
 
-    def run_all(self):
-        for task in self.tasks_to_run:
-            task()
-        rprint(Panel("[green]Mock background task (document cleanup) executed successfully.[/green]", title="[bold cyan]Cleanup[/bold cyan]"))
+    work_dir = tempfile.mkdtemp(prefix="rag-test-")
+    make_policy_pdf(os.path.join(work_dir, "policy.pdf"), pages=5)
+    os.environ["GOOGLE_API_BASE_URL"] = start_stub_server(port=8767, llm_latency=0.0, embed_latency=0.0)
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-test")
+    os.environ["INDEX_CACHE_DIR"] = os.path.join(work_dir, "index_cache")
+    return f"{serve_directory(work_dir)}/policy.pdf", QUESTIONS[:3]
 
 
-def run_test():
-    TEST_DOCUMENT_URL = "https://arxiv.org/pdf/1706.03762.pdf"
-    TEST_QUESTIONS = [
-        "What is a Transformer and what are its components?",
-        "What was the BLEU score for the big Transformer model on the English-to-German translation task shown in Table 2?",
-        "How is the transformer model better from its predecessors?"
-    ]
+def run_test(live: bool = False):
+    document_url, questions = (LIVE_DOCUMENT_URL, LIVE_QUESTIONS) if live else offline_setup()
+    from query_service import QueryService
 
     rprint(Panel(
-        f"Document URL: [blue]{TEST_DOCUMENT_URL}[/blue]\n"
-        f"Questions: [yellow]{len(TEST_QUESTIONS)}[/yellow]",
+        f"Document URL: [blue]{document_url}[/blue]\n"
+        f"Questions: [yellow]{len(questions)}[/yellow]",
         title="[bold green]Starting Batch Query Service Test[/bold green]",
         border_style="green"
     ))
 
     query_service = QueryService()
-    mock_background_tasks = MockBackgroundTasks()
 
     try:
         results = query_service.process_queries(
-            document_url=TEST_DOCUMENT_URL,
-            questions=TEST_QUESTIONS,
-            background_tasks=mock_background_tasks
+            document_url=document_url,
+            questions=questions
         )
     except Exception as e:
         rprint(Panel(f"[bold red]An error occurred during processing:[/bold red]\n{e}", title="[red]Test Failed[/red]"))
-        return
+        return False
 
-    results = query_service.process_queries(
-        document_url=TEST_DOCUMENT_URL,
-        questions=TEST_QUESTIONS
-    )
     rprint(Panel("[bold green]Processing Complete. Displaying Results...[/bold green]"))
 
-    for i, res in enumerate(results):
+    for i, answer in enumerate(results.answers):
         question_panel = Panel(
-            f"[bold]Answer:[/bold] {res.answer}",
-            title=f"[bold magenta]Result for Question #{i+1}[/bold magenta]: {TEST_QUESTIONS[i]}",
+            f"[bold]Answer:[/bold] {answer}",
+            title=f"[bold magenta]Result for Question #{i+1}[/bold magenta]: {questions[i]}",
             border_style="magenta",
             expand=True
         )
         rprint(question_panel)
-
-    mock_background_tasks.run_all()
+    return len(results.answers) == len(questions)
 
 
 if __name__ == "__main__":
-    run_test()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="use arxiv.org and the real Gemini API instead of local stubs")
+    sys.exit(0 if run_test(parser.parse_args().live) else 1)
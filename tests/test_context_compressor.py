@@ -0,0 +1,77 @@
+from langchain_core.documents import Document
+
+from batch_planner import estimate_tokens
+from context_compressor import compress_documents
+
+POLICY = Document(
+    id="chunk-0",
+    page_content=(
+        "The insurer shall pay claims within 30 days of notice. "
+        "Maternity expenses are covered after a waiting period of 24 months. "
+        "Dental cover is limited to 10000 per year. "
+        "Cosmetic surgery is excluded unless it follows an accident."
+    ),
+    metadata={"chunk_id": "chunk-0"},
+)
+
+
+def test_keeps_relevant_sentences_only():
+    compressed = compress_documents(["What is the maternity waiting period?"], [POLICY])
+    assert len(compressed) == 1
+    assert "24 months" in compressed[0].page_content
+    assert "Cosmetic surgery" not in compressed[0].page_content
+
+
+def test_question_without_shared_words_keeps_its_top_chunk():
+    assert compress_documents(["xyzzy quux?"], [POLICY]) == [POLICY]
+
+
+def test_paraphrased_question_keeps_its_top_chunk():
+    documents = [POLICY]
+    assert compress_documents(["How long before childbirth costs are reimbursed?"], documents) == documents
+
+
+def test_unmatched_question_does_not_lift_the_budget():
+    chunks = [
+        Document(id=f"chunk-{i}", page_content=f"Section {i}. " + "Terms apply to every insured person. " * 20, metadata={})
+        for i in range(3)
+    ]
+    questions = ["What is the maternity waiting period?", "xyzzy quux?"]
+    compressed = compress_documents(
+        questions, [POLICY, *chunks], tokens_per_question=200, max_tokens=400,
+        question_documents=[[POLICY], [chunks[2], chunks[0], chunks[1]]],
+    )
+    assert compressed[-1] == chunks[2]
+    assert chunks[0] not in compressed and chunks[1] not in compressed
+    assert "24 months" in compressed[0].page_content
+    assert "Cosmetic surgery" not in compressed[0].page_content
+
+
+def test_every_question_keeps_its_best_unit_over_budget():
+    questions = ["What is the maternity waiting period?", "What is the dental limit?"]
+    compressed = compress_documents(questions, [POLICY], tokens_per_question=1, max_tokens=1)
+    text = "\n".join(doc.page_content for doc in compressed)
+    assert "24 months" in text
+    assert "10000" in text
+
+
+def test_oversized_sentence_is_split():
+    words = [f"filler{i}" for i in range(400)]
+    words[200] = "maternity waiting period 24 months"
+    document = Document(id="chunk-1", page_content=" ".join(words), metadata={"chunk_id": "chunk-1"})
+    compressed = compress_documents(["What is the maternity waiting period?"], [document], tokens_per_question=100)
+    assert len(compressed) == 1
+    assert "24 months" in compressed[0].page_content
+    assert estimate_tokens(compressed[0].page_content) < estimate_tokens(document.page_content)
+
+
+def test_table_row_brings_its_header():
+    document = Document(
+        id="chunk-2",
+        page_content="Benefit | Limit\nMaternity | 50000\nDental | 10000\nOptical | 5000",
+        metadata={"chunk_id": "chunk-2"},
+    )
+    compressed = compress_documents(["What is the dental limit?"], [document], tokens_per_question=8)
+    text = compressed[0].page_content
+    assert "Dental | 10000" in text
+    assert text.startswith("Benefit | Limit")
@@ -0,0 +1,185 @@
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+import llm
+from llm import ModelGate, ModelOverloadedError, TokenBucket, backoff_delay, call_model_sync, is_retryable
+
+
+class StatusError(Exception):
+    def __init__(self, code: int, message: str = ""):
+        super().__init__(message or f"status {code}")
+        self.code = code
+
+
+@pytest.fixture(autouse=True)
+def fresh_gates(monkeypatch):
+    monkeypatch.setattr(llm, "_gates", {})
+
+
+def test_token_bucket_serves_burst_then_paces():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_token_bucket_caps_oversized_reservations():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve(100) == 0
+    assert bucket.reserve(1) == pytest.approx(0.1, abs=0.01)
+
+
+def test_token_bucket_without_rate_is_unlimited():
+    bucket = TokenBucket(rate=0, capacity=0)
+    assert all(bucket.reserve(1000) == 0 for _ in range(100))
+
+
+def test_backoff_delay_grows_within_cap(monkeypatch):
+    monkeypatch.setattr(llm, "MODEL_BACKOFF_BASE_SECONDS", 0.5)
+    monkeypatch.setattr(llm, "MODEL_BACKOFF_MAX_SECONDS", 4.0)
+    for attempt in range(8):
+        delays = [backoff_delay(attempt) for _ in range(200)]
+        assert 0 <= min(delays) and max(delays) <= min(4.0, 0.5 * 2 ** attempt)
+
+
+def test_backoff_delay_honours_retry_hint(monkeypatch):
+    monkeypatch.setattr(llm, "MODEL_BACKOFF_MAX_SECONDS", 20.0)
+    error = StatusError(429, "Resource exhausted. {'retryDelay': '3s'}")
+    assert all(3.0 <= backoff_delay(0, error) <= 3.6 for _ in range(50))
+    assert backoff_delay(0, StatusError(429, "retryDelay: 60s")) == 20.0
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (StatusError(429), True),
+    (StatusError(503), True),
+    (StatusError(408), True),
+    (StatusError(400), False),
+    (StatusError(404), False),
+    (ValueError("bad output"), False),
+    (httpx.ConnectError("refused"), True),
+    (asyncio.TimeoutError(), True),
+])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) is retryable
+
+
+def test_is_retryable_follows_the_cause_chain():
+    try:
+        try:
+            raise StatusError(503)
+        except StatusError as e:
+            raise RuntimeError("wrapped") from e
+    except RuntimeError as wrapped:
+        assert is_retryable(wrapped)
+
+
+def test_hedged_call_cancels_the_slow_attempt(monkeypatch):
+    monkeypatch.setattr(llm, "MODEL_HEDGE_MIN_DELAY_SECONDS", 0.01)
+    gate = ModelGate("test-model")
+    gate.latencies.extend([0.01] * 50)
+    started, cancelled = [], []
+
+    async def invoke():
+        started.append(len(started))
+        if len(started) == 1:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+        return "fast"
+
+    async def run():
+        result = await gate.run(invoke, hedge=True)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == "fast"
+    assert len(started) == 2 and cancelled == [True]
+    assert gate.counts["hedges"] == 1 and gate.counts["hedge_wins"] == 1
+
+
+def test_call_model_sync_retries_then_succeeds(monkeypatch):
+    monkeypatch.setattr(llm, "backoff_delay", lambda attempt, exc=None: 0)
+    outcomes = [StatusError(429), StatusError(503), "ok"]
+
+    def invoke(model):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert call_model_sync("test-model", invoke, max_retries=2) == "ok"
+    stats = llm.model_stats()["test-model"]
+    assert stats["retries"] == 2 and stats["rate_limited"] == 1 and stats["failures"] == 0
+
+
+def test_call_model_sync_raises_overloaded_after_retries(monkeypatch):
+    monkeypatch.setattr(llm, "backoff_delay", lambda attempt, exc=None: 0)
+
+    def invoke(model):
+        raise StatusError(429)
+
+    with pytest.raises(ModelOverloadedError):
+        call_model_sync("test-model", invoke, max_retries=1)
+
+
+def test_call_model_sync_does_not_retry_client_errors():
+    calls = []
+
+    def invoke(model):
+        calls.append(model)
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        call_model_sync("test-model", invoke, max_retries=3)
+    assert len(calls) == 1
+
+
+def test_sync_and_async_callers_share_the_concurrency_limit():
+    gate = ModelGate("test-model", max_concurrency=2)
+    peak, release = [0], threading.Event()
+
+    def track():
+        peak[0] = max(peak[0], gate.in_flight)
+
+    def invoke_sync():
+        track()
+        release.wait(5)
+        return "sync"
+
+    async def invoke():
+        track()
+        await asyncio.sleep(0.05)
+        return "async"
+
+    async def run():
+        threads = [asyncio.to_thread(gate.run_sync, invoke_sync) for _ in range(2)]
+        calls = asyncio.gather(*threads, *(gate.run(invoke) for _ in range(2)))
+        await asyncio.sleep(0.1)
+        assert gate.in_flight == 2
+        release.set()
+        return await calls
+
+    assert asyncio.run(run()) == ["sync", "sync", "async", "async"]
+    assert peak[0] == 2 and gate.in_flight == 0
+
+
+def test_cancelled_waiter_does_not_leak_its_slot():
+    gate = ModelGate("test-model", max_concurrency=1)
+
+    async def run():
+        hold = asyncio.ensure_future(gate.run(lambda: asyncio.sleep(0.05)))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(gate.run(lambda: asyncio.sleep(0)))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(hold, waiter, return_exceptions=True)
+        await gate.run(lambda: asyncio.sleep(0))
+
+    asyncio.run(run())
+    assert gate.in_flight == 0
@@ -0,0 +1,45 @@
+import uuid
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+import retriever
+from embeddings import HashingEmbeddings
+from retriever import VectorStoreProvider, get_chroma_client
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    monkeypatch.setattr(retriever, "_chroma_collections", retriever.OrderedDict())
+    monkeypatch.setattr(retriever, "CHROMA_MAX_COLLECTIONS", 1)
+    yield lambda: VectorStoreProvider(None, embedding_model=HashingEmbeddings(), vector_store_backend="chroma")
+    for name in list(retriever._chroma_collections):
+        get_chroma_client().delete_collection(name)
+
+
+def build(provider):
+    docs = [Document(page_content=f"chunk {i}", metadata={"chunk_id": f"c{i}"}) for i in range(3)]
+    vectors = np.asarray(HashingEmbeddings().embed_documents([doc.page_content for doc in docs]), dtype=np.float32)
+    provider.retriever = provider._build_store(uuid.uuid4().hex, docs, vectors).as_retriever()
+    return provider
+
+
+def collections():
+    return {collection.name for collection in get_chroma_client().list_collections()}
+
+
+def test_leased_collection_is_not_evicted(provider):
+    first = build(provider())
+    with first.lease() as leased:
+        second = build(provider())
+        assert {first.collection_name, second.collection_name} <= collections()
+        assert leased.invoke("chunk 1")
+    third = build(provider())
+    assert collections() & {first.collection_name, second.collection_name, third.collection_name} == {third.collection_name}
+
+
+def test_unleased_collections_are_evicted_lru_first(provider):
+    first, second = build(provider()), build(provider())
+    assert first.collection_name not in collections()
+    assert second.collection_name in collections()
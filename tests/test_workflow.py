@@ -0,0 +1,58 @@
+import asyncio
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from bm25 import BM25Index
+from embeddings import HashingEmbeddings
+from numpy_store import NumpyVectorStore
+from retriever import HybridRetriever, abatch_search_with_similarity
+from workflow import needs_decomposition
+
+
+def hits(*scores):
+    return [(Document(id=f"chunk-{i}", page_content=str(i)), score) for i, score in enumerate(scores)]
+
+
+def test_cosine_hit_that_stands_out_is_confident():
+    assert not needs_decomposition(hits(0.82, 0.61, 0.58, 0.55, 0.50))
+
+
+def test_flat_cosine_hits_need_decomposition():
+    assert needs_decomposition(hits(0.62, 0.61, 0.60, 0.60, 0.59))
+
+
+def test_low_top_score_needs_decomposition():
+    assert needs_decomposition(hits(0.30, 0.10, 0.05), min_top_score=0.5)
+    assert not needs_decomposition(hits(0.30, 0.10, 0.05), min_top_score=0.0)
+
+
+def test_single_or_no_hit():
+    assert not needs_decomposition(hits(0.7))
+    assert not needs_decomposition([])
+    assert needs_decomposition(hits(0.0, 0.0))
+
+
+def test_rrf_scores_look_flat_even_for_a_perfect_hit():
+    # Rank 1 in both the vector and the keyword list, then ranks 2-5 in both.
+    assert needs_decomposition(hits(*(2 / (61 + rank) for rank in range(5))))
+
+
+@pytest.fixture
+def hybrid_retriever():
+    embeddings = HashingEmbeddings()
+    benefits = ["maternity", "dental", "optical", "surgery", "physiotherapy", "ayurveda", "cataract", "hernia"]
+    texts = [f"The waiting period for {benefit} benefits is {24 + i} months." for i, benefit in enumerate(benefits)]
+    documents = [Document(id=f"chunk-{i}", page_content=text, metadata={"chunk_id": f"chunk-{i}"}) for i, text in enumerate(texts)]
+    store = NumpyVectorStore(embeddings, documents, np.asarray(embeddings.embed_documents(texts), dtype=np.float32))
+    return HybridRetriever(vectorstore=store, search_kwargs={"k": 5}, bm25=BM25Index(documents))
+
+
+def test_hybrid_search_judges_confidence_on_similarity(hybrid_retriever):
+    question = "What is the waiting period for maternity?"
+    fused, similarity = asyncio.run(abatch_search_with_similarity(hybrid_retriever, [question], 5))
+    assert "maternity" in fused[0][0][0].page_content
+    assert "maternity" in similarity[0][0][0].page_content
+    assert needs_decomposition(fused[0])
+    assert not needs_decomposition(similarity[0])
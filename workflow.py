@@ -1,29 +1,76 @@
+import asyncio
 import json
 import re
-from typing import TypedDict, List
+from typing import AsyncIterator, Dict, TypedDict, List, Optional, Tuple
 from langchain_core.documents import Document
+from langgraph.config import get_stream_writer
 from langgraph.graph import StateGraph, END
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.vectorstores import VectorStoreRetriever
+from langchain_core.exceptions import OutputParserException
 from langchain_core.output_parsers import StrOutputParser
-from models import FinalAnswer
-from config import ANSWER_LLM_MODEL, QUERY_LLM_MODEL, GOOGLE_API_KEY
+import metrics
+from llm import call_model, get_chat_model
+from batch_planner import plan_generation_batches, chunk_key, estimate_tokens
+from context_compressor import compress_documents
+from models import AnswerBatch, StreamEvent
+from retriever import abatch_search_with_similarity
+from config import (
+    ANSWER_LLM_MODEL, QUERY_LLM_MODEL, ENABLE_QUERY_DECOMPOSITION,
+    ADAPTIVE_QUERY_DECOMPOSITION, DECOMPOSITION_MIN_TOP_SCORE, DECOMPOSITION_MIN_SCORE_MARGIN,
+    GENERATION_MAX_CONTEXT_TOKENS, GENERATION_MAX_QUESTIONS_PER_BATCH, GENERATION_MAX_PARALLEL,
+    CONTEXT_COMPRESSION_ENABLED,
+)
+
+NOT_ENOUGH_INFORMATION = "Not enough information"
 
 class GraphState(TypedDict):
     original_questions: List[str]
-    decomposed_queries: List[str]
+    decomposed_queries: List[List[str]]
     retriever: VectorStoreRetriever
+    top_k: Optional[int]
+    decompose: bool
+    adaptive: bool
+    uncertain: List[int]
+    query_hits: Dict[str, List[Tuple[Document, float]]]
     documents: List[Document]
+    question_documents: List[List[Document]]
     generation: List[str]
 
+def needs_decomposition(
+    hits: List[Tuple[Document, float]],
+    min_top_score: float = DECOMPOSITION_MIN_TOP_SCORE,
+    min_margin: float = DECOMPOSITION_MIN_SCORE_MARGIN,
+) -> bool:
+    """
+    Whether a question's own hits look too weak to answer from: the top score is
+    below `min_top_score`, or it stands less than `min_margin` (relative) above the
+    mean of the other top-k hits, so no chunk clearly matches. Expects similarity
+    scores: RRF scores fall off by rank alone, so even a perfect hit looks flat.
+    """
+    if not hits:
+        return False
+    top, rest = hits[0][1], [score for _, score in hits[1:]]
+    if top <= 0 or top < min_top_score:
+        return True
+    return bool(rest) and (top - sum(rest) / len(rest)) / top < min_margin
+
 class RAGWorkflow:
-    def __init__(self):
-        self.base_generation_llm = ChatGoogleGenerativeAI(model=ANSWER_LLM_MODEL, api_key=GOOGLE_API_KEY, temperature=0)
-        self.decomposition_llm = ChatGoogleGenerativeAI(model=QUERY_LLM_MODEL, api_key=GOOGLE_API_KEY, temperature=0)
+    def __init__(
+        self,
+        generation_llm: Optional[BaseChatModel] = None,
+        decomposition_llm: Optional[BaseChatModel] = None,
+        adaptive_decomposition: bool = ADAPTIVE_QUERY_DECOMPOSITION,
+    ):
+        self.base_generation_llm = generation_llm or get_chat_model(ANSWER_LLM_MODEL)
+        self.decomposition_llm = decomposition_llm or get_chat_model(QUERY_LLM_MODEL)
+        self.adaptive_decomposition = adaptive_decomposition
+        self._decomposition_stats = {"requests": 0, "questions": 0, "rewritten_questions": 0, "llm_calls": 0, "llm_calls_saved": 0}
         self.graph = self._build_graph()
 
-    def _query_decomposition_node(self, state: GraphState):
+    @metrics.timed("node_decompose_query")
+    async def _query_decomposition_node(self, state: GraphState):
         prompt = ChatPromptTemplate.from_template(
             """🔍 You are an intelligent query decomposition engine.
 Given a list of user questions, generate 3 diverse search queries for each one.
@@ -40,31 +87,117 @@ QUESTIONS:
 {questions}
 """
         )
-        chain = prompt | self.decomposition_llm | StrOutputParser()
-        joined_questions = "\n".join([f"{i+1}. {q}" for i, q in enumerate(state["original_questions"])])
-        response_str = chain.invoke({"questions": joined_questions})
+        questions = state["original_questions"]
+        indexes = state.get("uncertain")
+        if indexes is None:
+            indexes = list(range(len(questions)))
+            self._record_decomposition(len(questions), len(indexes))
+        joined_questions = "\n".join([f"{n+1}. {questions[i]}" for n, i in enumerate(indexes)])
+        with metrics.span("decompose_llm"):
+            response_str = await call_model(
+                QUERY_LLM_MODEL,
+                lambda model: (prompt | self._llm(model) | StrOutputParser()).ainvoke(
+                    {"questions": joined_questions}, config=metrics.llm_config(model)
+                ),
+                tokens=estimate_tokens(joined_questions),
+            )
 
         try:
             clean_str = re.sub(r'^```json\s*|\s*```$', '', response_str, flags=re.MULTILINE).strip()
             parsed_lists = json.loads(clean_str)
         except json.JSONDecodeError:
-            parsed_lists = [[q] for q in state["original_questions"]]
+            parsed_lists = []
+        if not isinstance(parsed_lists, list):
+            parsed_lists = []
+
+        per_question_queries = [[question] for question in questions]
+        for n, i in enumerate(indexes):
+            rewrites = parsed_lists[n] if n < len(parsed_lists) and isinstance(parsed_lists[n], list) else []
+            per_question_queries[i] = [str(q) for q in rewrites] + [questions[i]]
+        get_stream_writer()(StreamEvent(event="progress", stage="decompose", status="done"))
+        return {"decomposed_queries": per_question_queries}
+
+    @metrics.timed("node_retrieve")
+    async def _retrieval_node(self, state: GraphState):
+        """
+        Retrieves for every question's queries, skipping queries already searched in an
+        earlier pass. On the first pass of adaptive decomposition, also picks the
+        questions whose own hits are too weak and need rewriting.
+        """
+        per_question_queries = state.get("decomposed_queries") or [[q] for q in state["original_questions"]]
+        hits_by_query = dict(state.get("query_hits") or {})
+        queries = [q for q in dict.fromkeys(q for question_queries in per_question_queries for q in question_queries) if q not in hits_by_query]
+        hits, similarity_hits = await abatch_search_with_similarity(state["retriever"], queries, state.get("top_k"))
+        hits_by_query.update(zip(queries, hits))
+
+        unique_docs_dict, question_documents = {}, []
+        for question_queries in per_question_queries:
+            best_hits = {}
+            for query in question_queries:
+                for doc, score in hits_by_query[query]:
+                    key = chunk_key(doc)
+                    unique_docs_dict.setdefault(key, doc)
+                    if key not in best_hits or score > best_hits[key][1]:
+                        best_hits[key] = (doc, score)
+            question_documents.append([doc for doc, _ in sorted(best_hits.values(), key=lambda hit: hit[1], reverse=True)])
+        writer = get_stream_writer()
+        writer(StreamEvent(event="progress", stage="retrieve", status="done", chunks=len(unique_docs_dict)))
+        update = {"documents": list(unique_docs_dict.values()), "question_documents": question_documents, "query_hits": hits_by_query}
+        if state.get("decompose") and state.get("adaptive") and state.get("uncertain") is None:
+            # Judged on vector similarity: in hybrid mode `hits` carry RRF scores, which are near-flat by construction.
+            similarity_by_query = dict(zip(queries, similarity_hits))
+            questions = state["original_questions"]
+            uncertain = [i for i, question in enumerate(questions) if needs_decomposition(similarity_by_query[question])]
+            self._record_decomposition(len(questions), len(uncertain))
+            if not uncertain:
+                writer(StreamEvent(event="progress", stage="decompose", status="skipped"))
+            update["uncertain"] = uncertain
+        return update
 
-        all_queries = [q for sublist in parsed_lists for q in sublist] + state["original_questions"]
-        return {"decomposed_queries": all_queries}
+    @metrics.timed("node_generate")
+    async def _generation_node(self, state: GraphState):
+        questions = state["original_questions"]
+        question_documents = state.get("question_documents") or [state["documents"]] * len(questions)
+        batches = plan_generation_batches(questions, question_documents, GENERATION_MAX_CONTEXT_TOKENS, GENERATION_MAX_QUESTIONS_PER_BATCH)
+        semaphore = asyncio.Semaphore(GENERATION_MAX_PARALLEL)
+        answers: List[Optional[str]] = [None] * len(questions)
+        writer = get_stream_writer()
 
-    def _retrieval_node(self, state: GraphState):
-        all_retrieved_docs = []
-        for q in state["decomposed_questions"].queries:
-            retrieved = state["retriever"].invoke(q)
-            all_retrieved_docs.extend(retrieved)
-        unique_docs_dict = {doc.page_content: doc for doc in all_retrieved_docs}
-        return {"documents": list(unique_docs_dict.values())}
+        async def run_batch(batch):
+            batch_questions = [questions[i] for i in batch.question_indexes]
+            documents = await self._acompress(batch_questions, batch.documents, [question_documents[i] for i in batch.question_indexes])
+            async with semaphore:
+                batch_answers = await self._agenerate_answers(batch_questions, documents)
+            for i, answer in zip(batch.question_indexes, batch_answers):
+                answers[i] = answer if answer is not None else NOT_ENOUGH_INFORMATION
+                writer(StreamEvent(event="answer", index=i, answer=answers[i], fallback=True if answer is None else None))
 
-    def _generation_node(self, state: GraphState):
-        context = "\n\n---\n\n".join([doc.page_content for doc in state["documents"]])
+        await asyncio.gather(*(run_batch(batch) for batch in batches))
+        writer(StreamEvent(event="progress", stage="generate", status="done"))
+        return {"generation": answers}
+
+    async def _acompress(self, questions: List[str], documents: List[Document], question_documents: List[List[Document]]) -> List[Document]:
+        """Trims the batch's chunks down to the sentences and table rows relevant to its questions."""
+        if not CONTEXT_COMPRESSION_ENABLED:
+            return documents
+        with metrics.span("compress"):
+            compressed = await asyncio.to_thread(compress_documents, questions, documents, question_documents=question_documents)
+        saved = sum(estimate_tokens(doc.page_content) for doc in documents) - sum(estimate_tokens(doc.page_content) for doc in compressed)
+        metrics.record_tokens(ANSWER_LLM_MODEL, "context_saved", max(saved, 0))
+        return compressed
+
+    async def _agenerate_answers(self, questions: List[str], documents: List[Document]) -> List[Optional[str]]:
+        """Answers one sub-batch, retrying once for any question the model left out; None where it still has no answer."""
+        answers = await self._acall_generation(questions, documents)
+        missing = [i for i, answer in enumerate(answers) if answer is None]
+        if missing:
+            retried = await self._acall_generation([questions[i] for i in missing], documents)
+            for i, answer in zip(missing, retried):
+                answers[i] = answer
+        return answers
 
-        structured_llm = self.base_generation_llm.with_structured_output(FinalAnswer)
+    async def _acall_generation(self, questions: List[str], documents: List[Document]) -> List[Optional[str]]:
+        context = "\n\n---\n\n".join([doc.page_content for doc in documents])
 
         prompt = ChatPromptTemplate.from_template(
             """📚 CONTEXT:
@@ -78,34 +211,108 @@ QUESTIONS:
 {questions}
 
 ⚠️ FORMAT:
-Return a list of objects with the field `answer` only.
+Return exactly one object per question, with the question's number in `question_number` and the answer in `answer`.
 Example:
-[{{"answer": "..."}}]
+{{"answers": [{{"question_number": 1, "answer": "..."}}]}}
 """
         )
 
-        joined_questions = "\n".join([f"{i+1}. {q}" for i, q in enumerate(state["original_questions"])])
-        chain = prompt | structured_llm
-        response = chain.invoke({
-            "context": context,
-            "questions": joined_questions,
-        })
+        joined_questions = "\n".join([f"{i+1}. {q}" for i, q in enumerate(questions)])
+        try:
+            with metrics.span("generate_llm"):
+                response = await call_model(
+                    ANSWER_LLM_MODEL,
+                    lambda model: (prompt | self._llm(model).with_structured_output(AnswerBatch)).ainvoke({
+                        "context": context,
+                        "questions": joined_questions,
+                    }, config=metrics.llm_config(model)),
+                    tokens=estimate_tokens(context) + estimate_tokens(joined_questions),
+                    fallback=QUERY_LLM_MODEL,
+                )
+        except OutputParserException:
+            return [None] * len(questions)
 
-        answers = [item.answer for item in response] if isinstance(response, list) else [response.answer]
-        return {"generation": answers}
+        items = response.answers if response else []
+        answers: List[Optional[str]] = [None] * len(questions)
+        for item in items:
+            if 1 <= item.question_number <= len(questions) and answers[item.question_number - 1] is None:
+                answers[item.question_number - 1] = item.answer
+        if all(answer is None for answer in answers) and len(items) == len(questions):
+            answers = [item.answer for item in items]
+        return answers
+
+    def _llm(self, model: str) -> BaseChatModel:
+        """The client for `model`; the workflow's own clients for the two configured models, so they can be injected."""
+        if model == ANSWER_LLM_MODEL:
+            return self.base_generation_llm
+        if model == QUERY_LLM_MODEL:
+            return self.decomposition_llm
+        return get_chat_model(model)
+
+    async def awarm_up(self) -> None:
+        """Sends one tiny prompt to each model so connections and client state are ready before real traffic."""
+        await asyncio.gather(
+            self.base_generation_llm.ainvoke("Reply with OK."),
+            self.decomposition_llm.ainvoke("Reply with OK."),
+        )
+
+    def _record_decomposition(self, questions: int, rewritten: int) -> None:
+        stats = self._decomposition_stats
+        stats["requests"] += 1
+        stats["questions"] += questions
+        stats["rewritten_questions"] += rewritten
+        stats["llm_calls" if rewritten else "llm_calls_saved"] += 1
+        metrics.record_decomposition(rewritten, questions - rewritten)
+
+    def decomposition_stats(self) -> dict:
+        """Counts over the requests that had decomposition on, including the decomposition calls adaptive routing saved."""
+        stats = dict(self._decomposition_stats)
+        stats["llm_calls_saved_per_request"] = round(stats["llm_calls_saved"] / stats["requests"], 3) if stats["requests"] else 0.0
+        return stats
+
+    def _route_start(self, state: GraphState) -> str:
+        return "decompose_query" if state.get("decompose", True) and not state.get("adaptive") else "retrieve"
+
+    def _route_after_retrieve(self, state: GraphState) -> str:
+        """Back to decomposition after an adaptive first pass that found weak questions, otherwise on to generation."""
+        return "decompose_query" if state.get("uncertain") and not state.get("decomposed_queries") else "generate"
 
     def _build_graph(self):
         workflow = StateGraph(GraphState)
         workflow.add_node("decompose_query", self._query_decomposition_node)
         workflow.add_node("retrieve", self._retrieval_node)
         workflow.add_node("generate", self._generation_node)
-        workflow.set_entry_point("decompose_query")
+        workflow.set_conditional_entry_point(self._route_start, {"decompose_query": "decompose_query", "retrieve": "retrieve"})
         workflow.add_edge("decompose_query", "retrieve")
-        workflow.add_edge("retrieve", "generate")
+        workflow.add_conditional_edges("retrieve", self._route_after_retrieve, {"decompose_query": "decompose_query", "generate": "generate"})
         workflow.add_edge("generate", END)
         return workflow.compile()
 
-    def invoke_batch(self, questions: List[str], retriever: VectorStoreRetriever) -> List[str]:
-        input_data = {"original_questions": questions, "retriever": retriever}
-        result = self.graph.invoke(input_data)
+    def _input(self, questions: List[str], retriever: VectorStoreRetriever, top_k: Optional[int], decompose: Optional[bool]) -> dict:
+        return {
+            "original_questions": questions,
+            "retriever": retriever,
+            "top_k": top_k,
+            "decompose": ENABLE_QUERY_DECOMPOSITION if decompose is None else decompose,
+            "adaptive": self.adaptive_decomposition,
+        }
+
+    async def ainvoke_batch(self, questions: List[str], retriever: VectorStoreRetriever, top_k: Optional[int] = None, decompose: Optional[bool] = None) -> List[str]:
+        result = await self.graph.ainvoke(self._input(questions, retriever, top_k, decompose))
         return result["generation"]
+
+    async def astream_batch(self, questions: List[str], retriever: VectorStoreRetriever, top_k: Optional[int] = None, decompose: Optional[bool] = None) -> AsyncIterator[StreamEvent]:
+        """
+        Yields progress events and one answer event per question (indexed into `questions`)
+        as each generation sub-batch finishes, then a final "complete" event with all answers.
+        """
+        state = {}
+        async for mode, chunk in self.graph.astream(self._input(questions, retriever, top_k, decompose), stream_mode=["custom", "values"]):
+            if mode == "custom":
+                yield chunk
+            else:
+                state = chunk
+        yield StreamEvent(event="complete", answers=state.get("generation", []))
+
+    def invoke_batch(self, questions: List[str], retriever: VectorStoreRetriever, top_k: Optional[int] = None, decompose: Optional[bool] = None) -> List[str]:
+        return asyncio.run(self.ainvoke_batch(questions, retriever, top_k, decompose))